@@ -0,0 +1,204 @@
+"""
+benchmark.py — Pipeline benchmark against a stored baseline.
+
+Generates a seeded synthetic OULAD dataset (generate_oulad.py), runs the full
+pipeline on it ``--repeat`` times with a cold extract cache, and reports the
+best wall time of each phase — extract, validate, load, transform, score,
+engagement_store, health_check, export, and "other" for any stage outside
+PHASES — taken from the run report.  Each result is compared with the
+baseline stored for the same backend and scale in benchmarks/baseline.json;
+any phase slower than baseline × (1 + tolerance) is a regression and the
+script exits 1 (CI reports it without failing the build: wall-clock times
+on shared runners are too noisy to gate on).
+
+Baselines are recorded on one machine and checked on another, so every
+result is first rescaled by a short fixed pandas/NumPy calibration workload
+timed on both.
+
+Usage:
+    python src/benchmark.py                                   # pandas, 0.05× scale
+    python src/benchmark.py --scale 1 --repeat 1              # full-size dataset
+    python src/benchmark.py --backend mysql --scale 0.1       # local MySQL (.env)
+    python src/benchmark.py --backend mysql --load-profile deferred
+    python src/benchmark.py --update-baseline                 # record new baseline
+"""
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import generate_oulad
+import run_pipeline
+
+# ── Logging ──────────────────────────────────────────────────────────────────
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s  %(levelname)-8s  %(message)s",
+    datefmt="%Y-%m-%dT%H:%M:%S",
+)
+log = logging.getLogger("benchmark")
+
+# ── Paths ─────────────────────────────────────────────────────────────────────
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = ROOT / "benchmarks" / "baseline.json"
+RESULTS = ROOT / "outputs" / "benchmark.json"
+
+PHASES = ["extract", "validate", "load", "transform", "score", "engagement_store",
+          "health_check", "export"]
+
+# Phases faster than this are dominated by timer noise; they may overrun the
+# baseline by up to MIN_SLACK seconds before counting as a regression.
+MIN_SLACK = 0.05
+
+
+def run_once(backend, data_dir, work_dir, load_profile="indexed"):
+    """Run the pipeline once over ``data_dir``; return seconds per phase."""
+    report = work_dir / "run_report.ndjson"
+    cache = work_dir / "extract_cache"
+    run_pipeline.CACHE_DIR = cache
+    run_pipeline.CACHE_INDEX = cache / "index.json"
+    argv = ["--backend", backend, "--data-dir", str(data_dir), "--output-dir", str(work_dir),
+            "--report", str(report), "--force"]
+    if backend == "mysql":
+        argv += ["--full-refresh", "--load-mode", "bulk", "--load-profile", load_profile]
+    t0 = time.perf_counter()
+    run_pipeline.main(argv)
+    wall = time.perf_counter() - t0
+
+    timings = dict.fromkeys([*PHASES, "other"], 0.0)
+    with open(report) as f:
+        for line in f:
+            rec = json.loads(line)
+            if rec["kind"] == "stage":
+                phase = rec["name"].split(":")[0]
+                timings[phase if phase in timings else "other"] += rec["seconds"]
+    timings["total"] = wall
+    return timings
+
+
+def calibrate(repeat=5):
+    """Seconds for a fixed groupby / sort workload — the machine's speed."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"k": rng.integers(0, 50_000, 5_000_000),
+                       "v": rng.integers(0, 100, 5_000_000)})
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        df.groupby("k")["v"].sum().sort_values()
+        np.sort(df["v"].to_numpy())
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def compare(result, baseline, tolerance):
+    """Phases of ``result`` slower than ``baseline`` allows.
+
+    Both are ``{"calibration": s, "phases": {phase: s}}``; baseline timings
+    are rescaled by the ratio of the two calibrations first.  Returns a list
+    of ``(phase, seconds, allowed)``.
+    """
+    speed = result["calibration"] / baseline["calibration"]
+    regressions = []
+    for phase, base in baseline["phases"].items():
+        seconds = result["phases"].get(phase)
+        if seconds is None:
+            continue
+        expected = base * speed
+        allowed = max(expected * (1 + tolerance), expected + MIN_SLACK)
+        if seconds > allowed:
+            regressions.append((phase, seconds, allowed))
+    return regressions
+
+
+def benchmark(backend, scale, seed, repeat, data_dir=None, load_profile="indexed"):
+    with tempfile.TemporaryDirectory(prefix="oulad_bench_") as tmp:
+        tmp = Path(tmp)
+        if data_dir is None:
+            data_dir = tmp / "data"
+            log.info("Generating OULAD × %g (seed %d)", scale, seed)
+            generate_oulad.generate(data_dir, scale=scale, seed=seed)
+
+        pipeline_log = logging.getLogger("oulad_pipeline")
+        level = pipeline_log.level
+        pipeline_log.setLevel(logging.WARNING)
+        runs = []
+        try:
+            for i in range(repeat):
+                work_dir = tmp / f"run_{i}"
+                work_dir.mkdir()
+                runs.append(run_once(backend, data_dir, work_dir, load_profile))
+                log.info("  run %d/%d: %.2f s", i + 1, repeat, runs[-1]["total"])
+        finally:
+            pipeline_log.setLevel(level)
+
+    phases = {p: round(min(r[p] for r in runs), 4) for p in [*PHASES, "other", "total"]}
+    return {"backend": backend, "scale": scale, "seed": seed, "repeat": repeat,
+            "calibration": round(calibrate(), 4), "phases": phases,
+            "recorded_at": datetime.now().isoformat(timespec="seconds")}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the OULAD pipeline.")
+    parser.add_argument("--backend", choices=run_pipeline.BACKENDS, default="pandas",
+                        help="pipeline backend to benchmark (default pandas; mysql uses .env)")
+    parser.add_argument("--scale", type=float, default=0.05,
+                        help="synthetic dataset size relative to the real one (default 0.05)")
+    parser.add_argument("--seed", type=int, default=507, help="generator seed (default 507)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="pipeline runs; the best time per phase counts (default 3)")
+    parser.add_argument("--load-profile", choices=run_pipeline.LOAD_PROFILES, default="indexed",
+                        help="mysql only: raw-table load profile (baselines are kept per profile)")
+    parser.add_argument("--data-dir", type=Path, default=None,
+                        help="benchmark existing CSVs instead of generating them")
+    parser.add_argument("--baseline", type=Path, default=BASELINE,
+                        help="baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown over the baseline (default 0.5 = +50%%)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store this result as the baseline instead of checking it")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = benchmark(args.backend, args.scale, args.seed, args.repeat, args.data_dir,
+                       args.load_profile)
+    key = f"{args.backend}@{args.scale:g}"
+    if args.backend == "mysql":
+        key += f"/{args.load_profile}"
+
+    log.info("Benchmark %s (calibration %.3f s)", key, result["calibration"])
+    for phase, seconds in result["phases"].items():
+        log.info("  %-16s %8.3f s", phase, seconds)
+    run_pipeline._write_json(RESULTS, {key: result})
+
+    baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if args.update_baseline:
+        baselines[key] = result
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        log.info("Baseline %s written to %s", key, args.baseline)
+        return 0
+    if key not in baselines:
+        log.warning("No baseline for %s in %s — nothing to compare", key, args.baseline)
+        return 0
+
+    regressions = compare(result, baselines[key], args.tolerance)
+    for phase, seconds, allowed in regressions:
+        log.error("  REGRESSION %-16s %.3f s (allowed %.3f s)", phase, seconds, allowed)
+    if regressions:
+        return 1
+    log.info("No regressions against baseline (tolerance +%.0f%%)", args.tolerance * 100)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
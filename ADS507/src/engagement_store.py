@@ -0,0 +1,244 @@
+"""
+engagement_store.py — Memory-mapped student × week engagement matrices.
+
+fact_weekly_engagement is long-format: one row per (student, week).  This
+store keeps it dense, one file per (code_module, code_presentation) holding
+three .npy records back to back:
+
+    <module>_<presentation>.bin   int64 [students], sorted — row i is student ids[i]
+                                  int64 [1] — the first week
+                                  int32 [2, students, weeks] — total_clicks, n_events
+    manifest.json                 first week, shape and build time per presentation
+
+Weeks run from the presentation's first week with activity (negative for
+pre-start activity) to its last; weeks without activity, and weeks whose
+clicks are all NULL, hold 0.  Rows with a NULL key or a NULL week are not
+stored.  Matrices are memory-mapped read-only, so a lookup reads only the
+pages it touches.  Each presentation's file is written to a temp file and
+renamed into place, so a reader sees its ids and matrix from the same build,
+and rebuilding one presentation leaves the others — and readers of the old
+file — untouched.
+
+The pipeline writes the store once the health check has passed
+(run_pipeline.py, DAG node ``engagement_store``).  Lookups:
+
+    store = EngagementStore("outputs/engagement_store")
+    store.student("AAA", "2013J", 11391)             # weekly DataFrame
+    store.cohort_mean("AAA", "2013J")                # mean clicks per week
+    store.cohort_percentiles("AAA", "2013J", [10, 50, 90], ids=[...])
+
+Usage:
+    python src/engagement_store.py AAA 2013J             # cohort curve
+    python src/engagement_store.py AAA 2013J --student 11391
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FIELDS = ["total_clicks", "n_events"]
+COURSE_KEYS = ["code_module", "code_presentation"]
+MANIFEST = "manifest.json"
+STORE_DIR = Path(__file__).resolve().parent.parent / "outputs" / "engagement_store"
+
+
+def _stem(module, presentation):
+    return f"{module}_{presentation}"
+
+
+def _save_atomic(path, *arrays):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            for array in arrays:
+                np.save(f, array)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def course_matrix(rows):
+    """``(ids, first_week, matrix)`` for one presentation's weekly rows."""
+    ids, row = np.unique(rows["id_student"].to_numpy(dtype="int64"), return_inverse=True)
+    week = rows["week_num"].to_numpy(dtype="int64")
+    first = int(week.min())
+    matrix = np.zeros((len(FIELDS), len(ids), int(week.max()) - first + 1), dtype=np.int32)
+    for i, field in enumerate(FIELDS):
+        matrix[i, row, week - first] = rows[field].to_numpy(dtype="float64", na_value=0)
+    return ids, first, matrix
+
+
+def _courses(batches):
+    """Yield ``((module, presentation), rows)`` from weekly-row ``batches``.
+
+    A presentation may span batches, which must then be ordered by
+    COURSE_KEYS; only one presentation's rows are held at a time.
+    """
+    key, pending = None, []
+    for batch in batches:
+        batch = batch.dropna(subset=COURSE_KEYS + ["id_student", "week_num"])
+        for k, rows in batch.groupby(COURSE_KEYS, observed=True, sort=False):
+            k = (str(k[0]), str(k[1]))
+            if k != key and pending:
+                yield key, pd.concat(pending)
+                pending = []
+            key = k
+            pending.append(rows)
+    if pending:
+        yield key, pd.concat(pending)
+
+
+def build_store(weekly, directory, presentations=None):
+    """Write ``weekly`` (fact_weekly_engagement rows) to the store in ``directory``.
+
+    ``weekly`` is a DataFrame or an iterable of DataFrame batches ordered by
+    COURSE_KEYS.  With ``presentations``, only those code_presentations are
+    rewritten and every other presentation's files are kept; otherwise the
+    store is replaced, and presentations no longer in ``weekly`` are removed.
+    Returns the number of (module, presentation) matrices written.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest_path = directory / MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+    if isinstance(weekly, pd.DataFrame):
+        weekly = [weekly]
+    if presentations is not None:
+        stale = {k for k, e in manifest.items() if e["code_presentation"] in presentations}
+    else:
+        stale = set(manifest)
+
+    built = datetime.now().isoformat(timespec="seconds")
+    written = set()
+    for (module, presentation), rows in _courses(weekly):
+        if presentations is not None and presentation not in presentations:
+            continue
+        ids, first, matrix = course_matrix(rows)
+        stem = _stem(module, presentation)
+        _save_atomic(directory / f"{stem}.bin", ids, np.array([first]), matrix)
+        manifest[stem] = {"code_module": module, "code_presentation": presentation,
+                          "first_week": first, "students": len(ids),
+                          "weeks": matrix.shape[2], "built_at": built}
+        written.add(stem)
+
+    for stem in stale - written:
+        del manifest[stem]
+        (directory / f"{stem}.bin").unlink(missing_ok=True)
+
+    tmp = manifest_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp, manifest_path)
+    return len(written)
+
+
+def read_course(path):
+    """``(ids, first_week, matrix)`` of one store file; the matrix is a read-only memmap."""
+    with open(path, "rb") as f:
+        ids = np.lib.format.read_array(f)
+        first = int(np.lib.format.read_array(f)[0])
+        version = np.lib.format.read_magic(f)
+        read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                       else np.lib.format.read_array_header_2_0)
+        shape, fortran, dtype = read_header(f)
+        offset = f.tell()
+    matrix = np.memmap(path, dtype=dtype, mode="r", shape=shape, offset=offset,
+                       order="F" if fortran else "C")
+    return ids, first, matrix
+
+
+class EngagementStore:
+    """Read side of the store; matrices are memory-mapped on first use.
+
+    The manifest is read once; open a new EngagementStore to see a rebuild.
+    A presentation's week numbers come from its file, not the manifest, so
+    they always match the matrix that was opened.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.manifest = json.loads((self.directory / MANIFEST).read_text())
+        self._open = {}   # stem -> (matrix memmap, {id_student: row}, first_week)
+
+    def presentations(self):
+        """``[(code_module, code_presentation), ...]`` in the store."""
+        return sorted((e["code_module"], e["code_presentation"])
+                      for e in self.manifest.values())
+
+    def weeks(self, module, presentation):
+        """Week numbers of the matrix columns."""
+        matrix, _, first = self._course(module, presentation)
+        return np.arange(first, first + matrix.shape[2])
+
+    def _course(self, module, presentation):
+        stem = _stem(module, presentation)
+        if stem not in self._open:
+            if stem not in self.manifest:
+                raise KeyError((module, presentation))
+            ids, first, matrix = read_course(self.directory / f"{stem}.bin")
+            self._open[stem] = matrix, dict(zip(ids.tolist(), range(len(ids)))), first
+        return self._open[stem]
+
+    def matrix(self, module, presentation, field="total_clicks"):
+        """The read-only students × weeks matrix of ``field``."""
+        return self._course(module, presentation)[0][FIELDS.index(field)]
+
+    def rows(self, module, presentation, ids):
+        """Matrix rows of ``ids``; KeyError for a student not in the presentation."""
+        index = self._course(module, presentation)[1]
+        return np.array([index[int(i)] for i in ids], dtype=np.int64)
+
+    def student(self, module, presentation, id_student):
+        """One student's weeks as a DataFrame (week_num, total_clicks, n_events)."""
+        matrix, index, _ = self._course(module, presentation)
+        row = index[int(id_student)]
+        return pd.DataFrame({"week_num": self.weeks(module, presentation),
+                             **{f: matrix[i, row] for i, f in enumerate(FIELDS)}})
+
+    def cohort_mean(self, module, presentation, ids=None, field="total_clicks"):
+        """Mean of ``field`` per week over ``ids`` (default: every student)."""
+        m = self.matrix(module, presentation, field)
+        if ids is not None:
+            m = m[self.rows(module, presentation, ids)]
+        return pd.Series(m.mean(axis=0), index=self.weeks(module, presentation), name=field)
+
+    def cohort_percentiles(self, module, presentation, q=(25, 50, 75), ids=None,
+                           field="total_clicks"):
+        """Percentiles ``q`` of ``field`` per week: a weeks × len(q) DataFrame."""
+        m = self.matrix(module, presentation, field)
+        if ids is not None:
+            m = m[self.rows(module, presentation, ids)]
+        return pd.DataFrame(np.percentile(m, q, axis=0).T, columns=list(q),
+                            index=pd.Index(self.weeks(module, presentation), name="week_num"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the weekly engagement store.")
+    parser.add_argument("code_module")
+    parser.add_argument("code_presentation")
+    parser.add_argument("--student", type=int, default=None,
+                        help="print this student's weeks instead of the cohort curve")
+    parser.add_argument("--store", type=Path, default=STORE_DIR,
+                        help="store directory (default: outputs/engagement_store)")
+    args = parser.parse_args(argv)
+
+    store = EngagementStore(args.store)
+    if args.student is not None:
+        out = store.student(args.code_module, args.code_presentation, args.student)
+    else:
+        out = store.cohort_percentiles(args.code_module, args.code_presentation,
+                                       [10, 50, 90]).assign(
+            mean=store.cohort_mean(args.code_module, args.code_presentation))
+    print(out.to_string())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+generate_oulad.py — Seeded synthetic OULAD dataset.
+
+Writes the seven OULAD CSVs (courses, assessments, vle, studentInfo,
+studentRegistration, studentAssessment, studentVle) with the real files'
+columns, value domains, "?" / empty NA conventions and quoting, at a
+configurable multiple of the real dataset's size.  Course, assessment and
+VLE-site catalogues keep their real sizes; students and clicks scale.
+
+Engagement is tied to the outcome (withdrawn and failing students click less
+and earlier), so early_risk_flags and the review queue are non-trivial.  The
+same seed and scale always produce byte-identical files.
+
+Usage:
+    python src/generate_oulad.py --out /tmp/oulad_1x                  # 10.6 M clicks
+    python src/generate_oulad.py --out /tmp/oulad_10x --scale 10      # 106 M clicks
+    python src/generate_oulad.py --out /tmp/oulad_ci --scale 0.05 --seed 7
+"""
+
+import argparse
+import csv
+import logging
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ── Logging ──────────────────────────────────────────────────────────────────
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s  %(levelname)-8s  %(message)s",
+    datefmt="%Y-%m-%dT%H:%M:%S",
+)
+log = logging.getLogger("generate_oulad")
+
+# ── Real dataset sizes (scale = 1) ───────────────────────────────────────────
+STUDENTS = 32_593
+CLICK_ROWS = 10_655_280
+SITES = 6_364
+ASSESSMENTS_PER_COURSE = 9
+MAX_SCALE = 10
+WRITE_CHUNK = 1_000_000
+
+PRESENTATIONS = {
+    "AAA": ["2013J", "2014J"],
+    "BBB": ["2013B", "2013J", "2014B", "2014J"],
+    "CCC": ["2014B", "2014J"],
+    "DDD": ["2013B", "2013J", "2014B", "2014J"],
+    "EEE": ["2013J", "2014B", "2014J"],
+    "FFF": ["2013B", "2013J", "2014B", "2014J"],
+    "GGG": ["2013J", "2014B", "2014J"],
+}
+ACTIVITY_TYPES = ["resource", "oucontent", "url", "homepage", "subpage", "forumng",
+                  "quiz", "page", "ouwiki", "dataplus", "glossary", "oucollaborate",
+                  "externalquiz", "questionnaire", "ouelluminate", "sharedsubpage",
+                  "dualpane", "repeatactivity", "folder", "htmlactivity"]
+REGIONS = ["East Anglian Region", "Scotland", "North Western Region",
+           "South East Region", "West Midlands Region", "Wales", "North Region",
+           "South Region", "Ireland", "South West Region", "East Midlands Region",
+           "Yorkshire Region", "London Region"]
+EDUCATION = ["HE Qualification", "A Level or Equivalent", "Lower Than A Level",
+             "Post Graduate Qualification", "No Formal quals"]
+IMD_BANDS = ["0-10%", "10-20", "20-30%", "30-40%", "40-50%", "50-60%", "60-70%",
+             "70-80%", "80-90%", "90-100%"]
+AGE_BANDS = ["0-35", "35-55", "55<="]
+
+# Outcome mix and, per outcome, relative click volume, how early in the
+# presentation the clicks fall (Beta shape), assessment submission rate and
+# mean score.
+RESULTS = ["Pass", "Withdrawn", "Fail", "Distinction"]
+RESULT_P = [0.38, 0.31, 0.22, 0.09]
+CLICK_WEIGHT = np.array([1.2, 0.35, 0.6, 1.6])
+ACTIVE_SPAN = np.array([1.0, 0.3, 0.8, 1.0])
+SUBMIT_P = np.array([0.9, 0.25, 0.6, 0.97])
+MEAN_SCORE = np.array([75.0, 60.0, 55.0, 88.0])
+
+
+def generate(out_dir, scale=1.0, seed=507):
+    """Write the seven OULAD CSVs for ``scale`` × the real size to ``out_dir``.
+
+    Returns ``{file name: data rows written}``.
+    """
+    if not 0 < scale <= MAX_SCALE:
+        raise ValueError(f"scale must be in (0, {MAX_SCALE}], got {scale}")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    counts = {}
+
+    courses = _courses(rng)
+    counts["courses.csv"] = _write(courses, out_dir / "courses.csv")
+
+    assessments = _assessments(rng, courses)
+    counts["assessments.csv"] = _write(assessments, out_dir / "assessments.csv")
+
+    vle = _vle(rng, courses)
+    counts["vle.csv"] = _write(vle, out_dir / "vle.csv")
+
+    students = _students(rng, courses, max(len(courses), round(STUDENTS * scale)))
+    counts["studentInfo.csv"] = _write(students.drop(columns=["course", "result"]),
+                                       out_dir / "studentInfo.csv")
+    counts["studentRegistration.csv"] = _write(_registrations(rng, students),
+                                               out_dir / "studentRegistration.csv", na_rep="")
+    counts["studentAssessment.csv"] = _write(_student_assessments(rng, students, assessments),
+                                             out_dir / "studentAssessment.csv")
+
+    t0 = time.perf_counter()
+    counts["studentVle.csv"] = _write_student_vle(rng, students, courses, vle,
+                                                  round(CLICK_ROWS * scale),
+                                                  out_dir / "studentVle.csv")
+    log.info("  studentVle.csv: %s rows in %.1f s",
+             f"{counts['studentVle.csv']:,}", time.perf_counter() - t0)
+    return counts
+
+
+def _courses(rng):
+    rows = [(m, p) for m, ps in PRESENTATIONS.items() for p in ps]
+    df = pd.DataFrame(rows, columns=["code_module", "code_presentation"])
+    # B presentations start in February and run shorter than J (October) ones.
+    is_b = df["code_presentation"].str.endswith("B").to_numpy()
+    df["module_presentation_length"] = np.where(is_b, rng.integers(234, 242, len(df)),
+                                                rng.integers(261, 270, len(df)))
+    return df
+
+
+def _assessments(rng, courses):
+    n = ASSESSMENTS_PER_COURSE
+    df = courses.loc[courses.index.repeat(n)].reset_index(drop=True)
+    k = np.tile(np.arange(n), len(courses))
+    length = df.pop("module_presentation_length").to_numpy()
+    df.insert(2, "id_assessment", np.arange(1, len(df) + 1) + 1_750)
+    kinds = np.array(["TMA"] * 5 + ["CMA"] * 3 + ["Exam"])
+    df["assessment_type"] = kinds[k]
+    date = (length * (k + 1) / (n + 1)).astype(int)
+    df["date"] = _with_na(date, (kinds[k] == "Exam") & (rng.random(len(df)) < 0.5))
+    weight = np.select([kinds[k] == "TMA", kinds[k] == "Exam"], [10.0, 100.0], 0.0)
+    df["weight"] = weight
+    df["length"] = length  # used for student_assessment dates, not written
+    return df
+
+
+def _vle(rng, courses):
+    site_course = np.sort(np.concatenate([np.arange(len(courses)),
+                                          rng.integers(0, len(courses), SITES - len(courses))]))
+    df = courses.iloc[site_course].reset_index(drop=True)
+    length = df.pop("module_presentation_length").to_numpy()
+    df.insert(0, "id_site", 546_000 + np.arange(SITES) * 7 + rng.integers(0, 7, SITES))
+    p = 1 / np.arange(1, len(ACTIVITY_TYPES) + 1)
+    df["activity_type"] = rng.choice(ACTIVITY_TYPES, SITES, p=p / p.sum())
+    planned = rng.random(SITES) < 0.18
+    week_from = rng.integers(0, 1 + length // 7 - 2)
+    df["week_from"] = _with_na(week_from, ~planned)
+    df["week_to"] = _with_na(week_from + rng.integers(0, 3, SITES), ~planned)
+    df["course"] = site_course
+    return df
+
+
+def _students(rng, courses, n):
+    course = np.sort(np.concatenate([np.arange(len(courses)),
+                                     rng.integers(0, len(courses), n - len(courses))]))
+    df = courses.iloc[course][["code_module", "code_presentation"]].reset_index(drop=True)
+    df["id_student"] = 3_000 + rng.choice(n * 80, n, replace=False)
+    df["gender"] = rng.choice(["M", "F"], n, p=[0.55, 0.45])
+    df["region"] = rng.choice(REGIONS, n)
+    df["highest_education"] = rng.choice(EDUCATION, n, p=[0.15, 0.43, 0.40, 0.01, 0.01])
+    df["imd_band"] = np.where(rng.random(n) < 0.034, "?", rng.choice(IMD_BANDS, n))
+    df["age_band"] = rng.choice(AGE_BANDS, n, p=[0.70, 0.29, 0.01])
+    df["num_of_prev_attempts"] = np.minimum(rng.geometric(0.85, n) - 1, 6)
+    df["studied_credits"] = 30 * rng.choice([2, 2, 2, 4, 4, 6, 8], n)
+    df["disability"] = rng.choice(["N", "Y"], n, p=[0.9, 0.1])
+    result = rng.choice(len(RESULTS), n, p=RESULT_P)
+    df["final_result"] = np.array(RESULTS)[result]
+    df["course"] = course
+    df["result"] = result
+    return df
+
+
+def _registrations(rng, students):
+    n = len(students)
+    df = students[["code_module", "code_presentation", "id_student"]].copy()
+    df["date_registration"] = _with_na(-rng.gamma(2.0, 35.0, n).astype(int),
+                                       rng.random(n) < 0.001)
+    withdrawn = students["result"].to_numpy() == RESULTS.index("Withdrawn")
+    df["date_unregistration"] = _with_na(rng.integers(-30, 200, n), ~withdrawn)
+    return df
+
+
+def _student_assessments(rng, students, assessments):
+    frames = []
+    by_course = students.groupby("course", sort=True)
+    course_ids = assessments.groupby(["code_module", "code_presentation"], sort=False).ngroup()
+    for course, group in by_course:
+        a = assessments[course_ids.to_numpy() == course]
+        result = np.repeat(group["result"].to_numpy(), len(a))
+        submitted = rng.random(len(result)) < SUBMIT_P[result]
+        date = a["date"].fillna(pd.Series(a["length"], index=a.index)).to_numpy(int)
+        df = pd.DataFrame({
+            "id_assessment": np.tile(a["id_assessment"].to_numpy(), len(group)),
+            "id_student": np.repeat(group["id_student"].to_numpy(), len(a)),
+            "date_submitted": np.tile(date, len(group)) + rng.integers(-5, 4, len(result)),
+            "is_banked": (rng.random(len(result)) < 0.01).astype(int),
+            "score": np.clip(rng.normal(MEAN_SCORE[result], 15), 0, 100).round(),
+        })[submitted]
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+    df["score"] = _with_na(df["score"].astype(int), rng.random(len(df)) < 0.001)
+    return df
+
+
+def _write_student_vle(rng, students, courses, vle, n_rows, path):
+    """Write ``n_rows`` click rows, WRITE_CHUNK at a time, grouped by student."""
+    result = students["result"].to_numpy()
+    weight = CLICK_WEIGHT[result] * rng.lognormal(0.0, 0.6, len(students))
+    per_student = rng.multinomial(n_rows, weight / weight.sum())
+
+    course = students["course"].to_numpy()
+    length = courses["module_presentation_length"].to_numpy()[course]
+    span = ACTIVE_SPAN[result]
+    sites = vle["id_site"].to_numpy()
+    site_course = vle["course"].to_numpy()
+    site_start = np.searchsorted(site_course, np.arange(len(courses)))
+    site_count = np.bincount(site_course, minlength=len(courses))
+    codes = students[["code_module", "code_presentation"]].to_numpy()
+    ids = students["id_student"].to_numpy()
+
+    ends = np.cumsum(per_student)
+    bounds = np.searchsorted(ends, np.arange(WRITE_CHUNK, n_rows, WRITE_CHUNK))
+    written = 0
+    with open(path, "w", newline="") as f:
+        f.write('"code_module","code_presentation","id_student","id_site","date","sum_click"\n')
+        for lo, hi in zip(np.r_[0, bounds + 1], np.r_[bounds + 1, len(students)]):
+            s = np.repeat(np.arange(lo, hi), per_student[lo:hi])
+            if len(s) == 0:
+                continue
+            c = course[s]
+            site = sites[site_start[c] + (rng.random(len(s)) * site_count[c]).astype(int)]
+            date = (rng.beta(1.2, 1.5, len(s)) * span[s] * (length[s] + 25)).astype(int) - 25
+            clicks = np.minimum(rng.geometric(0.3, len(s)), 6_977)
+            chunk = pd.DataFrame({
+                "code_module": codes[s, 0], "code_presentation": codes[s, 1],
+                "id_student": ids[s], "id_site": site, "date": date, "sum_click": clicks,
+            })
+            chunk.to_csv(f, header=False, index=False, quoting=csv.QUOTE_NONNUMERIC,
+                         lineterminator="\n")
+            written += len(chunk)
+    return written
+
+
+def _with_na(values, missing):
+    """``values`` as a nullable integer column, NA wherever ``missing``."""
+    out = pd.array(np.asarray(values), dtype="Int32")
+    out[np.asarray(missing)] = pd.NA
+    return out
+
+
+def _write(df, path, na_rep="?"):
+    """Write ``df`` the way the OULAD files are: strings quoted, numbers bare."""
+    df = df.drop(columns=[c for c in ("course", "length") if c in df.columns])
+    df.to_csv(path, index=False, quoting=csv.QUOTE_NONNUMERIC, na_rep=na_rep,
+              lineterminator="\n")
+    log.info("  %-26s %s rows", path.name, f"{len(df):,}")
+    return len(df)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic OULAD dataset.")
+    parser.add_argument("--out", type=Path, required=True,
+                        help="directory to write the seven CSVs to")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help=f"size relative to the real dataset, up to {MAX_SCALE} "
+                             "(1 = 32.6 k students, 10.6 M clicks)")
+    parser.add_argument("--seed", type=int, default=507, help="random seed (default 507)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    log.info("Generating OULAD × %g (seed %d) in %s", args.scale, args.seed, args.out)
+    generate(args.out, scale=args.scale, seed=args.seed)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except ValueError as exc:
+        log.error("%s", exc)
+        sys.exit(1)
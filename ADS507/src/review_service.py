@@ -0,0 +1,446 @@
+"""
+review_service.py — Low-latency JSON service over the latest pipeline run.
+
+Serves the instructor review queue, per-student weekly engagement and the
+KPIs from an in-memory index, so dashboard page views never reach MySQL:
+
+    GET /review-queue/<code_module>/<code_presentation>?n=5   top-N by engagement_rank
+    GET /students/<code_module>/<code_presentation>/<id_student>   weekly history
+    GET /kpis                                                 pipeline_kpis.csv as JSON
+    GET /health                                               run id and index size
+
+The index is built from the derived tables once a run passes: a follower
+thread polls the run report (run_report.ndjson) for a new ``passed`` run
+summary, builds a fresh index off the request path, then swaps it in with a
+single reference assignment.  Every request reads the index once, so it is
+answered entirely from the old or entirely from the new run; a failed
+rebuild keeps the old index serving.
+
+Queue rows are JSON-encoded once per build; weekly history is kept as
+sorted NumPy columns with one (start, stop) slice per student.
+
+Usage:
+    python src/review_service.py                          # mysql tables (.env), port 8507
+    python src/review_service.py --backend pandas         # outputs/ extracts of a pandas run
+    python src/review_service.py --benchmark --concurrency 16 --requests 20000
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import generate_oulad
+import run_pipeline
+
+# ── Logging ──────────────────────────────────────────────────────────────────
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s  %(levelname)-8s  %(message)s",
+    datefmt="%Y-%m-%dT%H:%M:%S",
+)
+log = logging.getLogger("review_service")
+
+DEFAULT_PORT = 8507
+DEFAULT_TOP_N = 5
+POLL_SECONDS = 2
+
+# The run report only grows; the last run summary is within this many bytes
+# of its end unless a single run wrote more step records than that.
+REPORT_TAIL_BYTES = 256 * 1024
+
+QUEUE_COLUMNS = ["id_student", "clicks_weeks_0_2", "final_result", "low_engagement_flag",
+                 "engagement_rank"]
+HISTORY_COLUMNS = ["week_num", "total_clicks", "n_events"]
+COURSE_KEYS = ["code_module", "code_presentation"]
+
+
+class ReviewIndex:
+    """Immutable, query-ready snapshot of one run's derived tables.
+
+    ``queue`` and ``weekly`` are instructor_review_queue and
+    fact_weekly_engagement; rows with a NULL key are not addressable and are
+    dropped.  Never mutated after construction, so readers need no lock.
+    """
+
+    def __init__(self, queue, weekly, kpis, run_id=None):
+        self.run_id = run_id
+        self.loaded_at = datetime.now().isoformat(timespec="seconds")
+
+        queue = (queue.dropna(subset=run_pipeline.KEY_COLUMNS)
+                 .sort_values(COURSE_KEYS + ["engagement_rank", "id_student"], kind="stable"))
+        self.courses = {}   # (module, presentation) -> [JSON-encoded row, ...] in rank order
+        for (module, presentation), rows in queue.groupby(COURSE_KEYS, sort=False,
+                                                          observed=True):
+            encoded = json.loads(rows[QUEUE_COLUMNS].to_json(orient="records"))
+            self.courses[str(module), str(presentation)] = [
+                json.dumps(r).encode() for r in encoded]
+
+        weekly = (weekly.dropna(subset=run_pipeline.KEY_COLUMNS)
+                  .sort_values(run_pipeline.KEY_COLUMNS + ["week_num"], na_position="first"))
+        self.history = {c: weekly[c].to_numpy(dtype="float64", na_value=np.nan)
+                        for c in HISTORY_COLUMNS}
+        keys = [weekly[c].astype(str).to_numpy() for c in COURSE_KEYS]
+        keys.append(weekly["id_student"].to_numpy(dtype="int64"))
+        change = np.ones(len(weekly), dtype=bool)
+        if len(weekly):
+            change[1:] = np.logical_or.reduce([k[1:] != k[:-1] for k in keys])
+        starts = np.flatnonzero(change)
+        stops = np.append(starts[1:], len(weekly))
+        self.students = {(keys[0][s], keys[1][s], int(keys[2][s])): (int(s), int(e))
+                         for s, e in zip(starts, stops)}
+
+        self.kpis = json.dumps(json.loads(kpis.to_json(orient="records"))[0]
+                               if len(kpis) else {}).encode()
+
+    def top(self, module, presentation, n=DEFAULT_TOP_N):
+        """JSON body of the course's first ``n`` queue rows, or None if unknown."""
+        rows = self.courses.get((module, presentation))
+        if rows is None:
+            return None
+        body = {"code_module": module, "code_presentation": presentation,
+                "run_id": self.run_id}
+        head = json.dumps(body)[:-1].encode()
+        return head + b', "students": [' + b", ".join(rows[:n]) + b"]}"
+
+    def student(self, module, presentation, id_student):
+        """JSON body of one student's weekly engagement, or None if unknown."""
+        span = self.students.get((module, presentation, id_student))
+        if span is None:
+            return None
+        s, e = span
+        weeks = [{c: None if np.isnan(v) else int(v)
+                  for c, v in zip(HISTORY_COLUMNS, row)}
+                 for row in zip(*(self.history[c][s:e] for c in HISTORY_COLUMNS))]
+        return json.dumps({"code_module": module, "code_presentation": presentation,
+                           "id_student": id_student, "run_id": self.run_id,
+                           "weeks": weeks}).encode()
+
+    def summary(self):
+        return {"run_id": self.run_id, "loaded_at": self.loaded_at,
+                "courses": len(self.courses), "students": len(self.students)}
+
+
+def index_from_backend(backend, run_id=None):
+    """Build a ReviewIndex from a pipeline backend's derived tables."""
+    queue = pd.concat(backend.stream_table("instructor_review_queue"), ignore_index=True)
+    weekly = pd.concat(backend.stream_table("fact_weekly_engagement"), ignore_index=True)
+    return ReviewIndex(queue, weekly, backend.kpis(), run_id)
+
+
+def index_from_exports(directory, run_id=None):
+    """Build a ReviewIndex from a run's ``--extract`` files in ``directory``.
+
+    The pandas backend keeps no tables after a run, so it is served from its
+    extracts of instructor_review_queue and fact_weekly_engagement (the
+    newest of .parquet, .arrow and .csv) and pipeline_kpis.csv.
+    """
+    directory = Path(directory)
+    frames = {}
+    for table in ["instructor_review_queue", "fact_weekly_engagement"]:
+        found = [p for p in (directory / f"{table}{ext}"
+                             for ext in run_pipeline.EXPORT_FORMATS.values()) if p.exists()]
+        if not found:
+            raise FileNotFoundError(f"no extract of {table} in {directory} "
+                                    f"(run the pipeline with --extract {table})")
+        path = max(found, key=lambda p: p.stat().st_mtime_ns)
+        readers = {".csv": pd.read_csv, ".parquet": pd.read_parquet,
+                   ".arrow": pd.read_feather}
+        frames[table] = readers[path.suffix](path)
+    return ReviewIndex(frames["instructor_review_queue"], frames["fact_weekly_engagement"],
+                       pd.read_csv(directory / "pipeline_kpis.csv"), run_id)
+
+
+def last_passed_run(report):
+    """run_id of the last run summary in ``report`` if that run passed, else None."""
+    report = Path(report)
+    if not report.exists():
+        return None
+    with open(report, "rb") as f:
+        f.seek(max(0, report.stat().st_size - REPORT_TAIL_BYTES))
+        lines = f.read().splitlines()
+    for line in reversed(lines):
+        try:
+            rec = json.loads(line)
+        except ValueError:   # first line of the tail, cut mid-record
+            continue
+        if rec.get("kind") == "run":
+            return rec["run_id"] if rec.get("status") == "passed" else None
+    return None
+
+
+class ReviewService:
+    """Holds the current ReviewIndex and swaps in a new one per passed run."""
+
+    def __init__(self, loader, report=None, poll=POLL_SECONDS):
+        self.loader = loader
+        self.report = Path(report) if report is not None else None
+        self.poll = poll
+        self.index = None
+        self._stat = None
+        self._stop = threading.Event()
+        self._follower = None
+
+    def swap(self, index):
+        """Make ``index`` current; in-flight requests finish on the old one."""
+        self.index = index
+
+    def reload(self, run_id=None):
+        """Build an index for ``run_id`` and swap it in; False if the build failed."""
+        t0 = time.perf_counter()
+        try:
+            index = self.loader(run_id)
+        except Exception as exc:
+            log.error("Index rebuild for run %s FAILED: %s — still serving run %s",
+                      run_id, exc, self.index.run_id if self.index else None)
+            return False
+        self.swap(index)
+        log.info("Index swapped to run %s (%s courses, %s students) in %.2f s",
+                 run_id, f"{len(index.courses):,}", f"{len(index.students):,}",
+                 time.perf_counter() - t0)
+        return True
+
+    def check_report(self):
+        """Reload if the report gained a passed run newer than the index; True if swapped."""
+        try:
+            st = self.report.stat()
+        except FileNotFoundError:
+            return False
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat == self._stat:
+            return False
+        self._stat = stat
+        run_id = last_passed_run(self.report)
+        if run_id is None or (self.index is not None and self.index.run_id == run_id):
+            return False
+        return self.reload(run_id)
+
+    def _follow(self):
+        while not self._stop.wait(self.poll):
+            self.check_report()
+
+    def start(self):
+        self._follower = threading.Thread(target=self._follow, name="report-follower",
+                                          daemon=True)
+        self._follower.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._follower is not None:
+            self._follower.join()
+
+
+class ReviewHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive: dashboards reuse one connection
+    # Headers and body go out as two writes; without TCP_NODELAY the second
+    # waits on the client's delayed ACK (~40 ms) on every keep-alive request.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        index = self.server.service.index   # one read: the whole answer is from one run
+        url = urlsplit(self.path)
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        if parts == ["health"]:
+            body = index.summary() if index is not None else {"run_id": None}
+            return self._send(200, json.dumps(body).encode())
+        if index is None:
+            return self._error(503, "no pipeline run loaded yet")
+
+        if parts == ["kpis"]:
+            return self._send(200, index.kpis)
+        if len(parts) == 3 and parts[0] == "review-queue":
+            try:
+                n = int(parse_qs(url.query).get("n", [DEFAULT_TOP_N])[0])
+            except ValueError:
+                return self._error(400, "n must be an integer")
+            body = index.top(parts[1], parts[2], max(n, 0))
+            return self._send(200, body) if body else self._error(404, "unknown course")
+        if len(parts) == 4 and parts[0] == "students":
+            if not parts[3].isdigit():
+                return self._error(400, "id_student must be an integer")
+            body = index.student(parts[1], parts[2], int(parts[3]))
+            return self._send(200, body) if body else self._error(404, "unknown student")
+        return self._error(404, "not found")
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({"error": message}).encode())
+
+    def log_message(self, fmt, *args):
+        log.debug("%s  " + fmt, self.address_string(), *args)
+
+
+def serve(service, host="127.0.0.1", port=DEFAULT_PORT):
+    """A started-on-demand HTTP server for ``service`` (port 0 picks a free one)."""
+    server = ThreadingHTTPServer((host, port), ReviewHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+# ── Benchmark ────────────────────────────────────────────────────────────────
+def benchmark(loader, requests=20_000, concurrency=16, swaps=5, seed=507):
+    """p50/p99 latency of a mixed request load against a local server.
+
+    ``concurrency`` clients with one keep-alive connection each send
+    ``requests`` in total — 70% top-N queue, 25% student history, 5% KPIs —
+    while ``loader`` rebuilds the index and it is hot-swapped ``swaps`` times.
+    Returns latency percentiles in ms, throughput and the count of non-200
+    answers.
+    """
+    service = ReviewService(loader)
+    service.reload("bench-0")
+    index = service.index
+    server = serve(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+
+    rng = np.random.default_rng(seed)
+    courses = list(index.courses)
+    students = list(index.students)
+    paths = []
+    for kind in rng.choice(3, size=requests, p=[0.70, 0.25, 0.05]):
+        if kind == 0:
+            m, p = courses[rng.integers(len(courses))]
+            paths.append(f"/review-queue/{m}/{p}?n={rng.integers(1, 51)}")
+        elif kind == 1:
+            m, p, s = students[rng.integers(len(students))]
+            paths.append(f"/students/{m}/{p}/{s}")
+        else:
+            paths.append("/kpis")
+
+    latencies = np.zeros(requests)
+    errors = [0] * concurrency
+
+    def client(worker):
+        conn = http.client.HTTPConnection(host, port)
+        for i in range(worker, requests, concurrency):
+            t0 = time.perf_counter()
+            conn.request("GET", paths[i])
+            resp = conn.getresponse()
+            resp.read()
+            latencies[i] = time.perf_counter() - t0
+            errors[worker] += resp.status != 200
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(w,)) for w in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for i in range(1, swaps + 1):
+        time.sleep(0.05)
+        service.reload(f"bench-{i}")
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    server.shutdown()
+    server.server_close()
+
+    ms = latencies * 1000
+    return {"requests": requests, "concurrency": concurrency, "swaps": swaps,
+            "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            "max_ms": round(float(ms.max()), 3),
+            "requests_per_sec": round(requests / wall, 1), "errors": sum(errors)}
+
+
+def synthetic_backend(scale, seed):
+    """PandasBackend holding the derived tables of a seeded synthetic dataset."""
+    with tempfile.TemporaryDirectory(prefix="oulad_review_") as tmp:
+        generate_oulad.generate(tmp, scale=scale, seed=seed)
+        tables = {"student_vle": run_pipeline.read_table(
+            "student_vle", Path(tmp) / "studentVle.csv")}
+        for name in ["student_info", "student_registration"]:
+            tables[name] = run_pipeline.read_table(
+                name, Path(tmp) / run_pipeline.RAW_FILES[name])
+    backend = run_pipeline.PandasBackend(tables)
+    backend.transform()
+    return backend
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve the review queue, engagement history and KPIs over HTTP.")
+    parser.add_argument("--backend", choices=run_pipeline.BACKENDS, default="mysql",
+                        help="mysql: read the derived tables (.env, default); pandas: read "
+                             "a pandas run's --extract files from --output-dir")
+    parser.add_argument("--host", default="127.0.0.1", help="bind address (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"port (default {DEFAULT_PORT})")
+    parser.add_argument("--output-dir", type=Path, default=None,
+                        help="the pipeline's output directory, holding its run report "
+                             "(default: outputs/)")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS,
+                        help=f"seconds between run-report checks (default {POLL_SECONDS})")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="measure p50/p99 latency on a synthetic dataset instead of serving")
+    parser.add_argument("--scale", type=float, default=0.05,
+                        help="benchmark dataset size relative to the real one (default 0.05)")
+    parser.add_argument("--requests", type=int, default=20_000,
+                        help="benchmark requests in total (default 20000)")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="benchmark client connections (default 16)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    outputs = args.output_dir or run_pipeline.OUTPUTS
+
+    if args.benchmark:
+        backend = synthetic_backend(args.scale, seed=507)
+        result = benchmark(lambda run_id: index_from_backend(backend, run_id),
+                           args.requests, args.concurrency)
+        log.info("Review service × %g: %s requests, %d clients, %d hot swaps",
+                 args.scale, f"{result['requests']:,}", result["concurrency"], result["swaps"])
+        for key in ["p50_ms", "p99_ms", "max_ms", "requests_per_sec", "errors"]:
+            log.info("  %-18s %10s", key, result[key])
+        outputs.mkdir(parents=True, exist_ok=True)
+        run_pipeline._write_json(outputs / "review_service_benchmark.json", result)
+        return 1 if result["errors"] else 0
+
+    if args.backend == "mysql":
+        backend = run_pipeline.MySQLBackend(run_pipeline.build_engine())
+
+        def loader(run_id):
+            return index_from_backend(backend, run_id)
+    else:
+        def loader(run_id):
+            return index_from_exports(outputs, run_id)
+
+    service = ReviewService(loader, outputs / "run_report.ndjson", poll=args.poll)
+    if not service.check_report():
+        log.warning("No passed pipeline run loaded yet — serving 503 until one finishes")
+    service.start()
+    server = serve(service, args.host, args.port)
+    log.info("Serving on http://%s:%d (following %s)", args.host, args.port,
+             service.report)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info("Shutting down review service.")
+    finally:
+        service.stop()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+risk_sweep.py — Early-risk threshold × week-window sweep.
+
+early_risk_flags flags a student whose clicks in weeks 0–2 total under 50.
+This script evaluates that rule for a whole grid of click thresholds and
+week windows in one pass over studentVle.csv, instead of one pipeline run
+per setting:
+
+  1. clicks per (student, week) are binned into a students × weeks matrix,
+     whose running sum along the weeks gives every window's total as one
+     subtraction;
+  2. per window, the totals are sorted once, and ``np.searchsorted`` counts
+     the students under every threshold at once — for all students and for
+     those who went on to fail or withdraw.
+
+Each (window, threshold) row reports the same counts as pipeline_kpis.csv
+(students_in_window, flagged_students, flagged_and_at_risk) plus precision
+and recall against the Fail/Withdrawn outcome.  The row for weeks 0–2 and
+threshold 50 reproduces the pipeline's KPIs exactly.
+
+Usage:
+    python src/risk_sweep.py                                   # default grid
+    python src/risk_sweep.py --thresholds 20,50,100 --windows 0-2,0-4,1-3
+    python src/risk_sweep.py --data-dir /tmp/oulad_1x --output /tmp/sweep.csv
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import run_pipeline
+
+# ── Logging ──────────────────────────────────────────────────────────────────
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s  %(levelname)-8s  %(message)s",
+    datefmt="%Y-%m-%dT%H:%M:%S",
+)
+log = logging.getLogger("risk_sweep")
+
+AT_RISK_RESULTS = ["Fail", "Withdrawn"]
+DEFAULT_THRESHOLDS = list(range(10, 210, 10))
+DEFAULT_WINDOWS = [(0, w) for w in range(6)]
+
+SWEEP_COLUMNS = ["window", "threshold", "students_in_window", "flagged_students",
+                 "flagged_and_at_risk", "at_risk_students", "precision", "recall"]
+
+
+def weekly_clicks(svle, info, last_week):
+    """Per-student cumulative clicks and activity over weeks 0..``last_week``.
+
+    Returns ``(clicks, events, counted, at_risk)``: running sums along the
+    weeks of the clicks, of the event rows and of the rows with a non-NULL
+    click count (students × (last_week + 2), column 0 all zero so that week
+    ``w``'s running total is column ``w + 1``), and each student's outcome.
+    Students are those in ``info`` with activity in the weeks; like the
+    pipeline's inner join, rows with NULL keys are dropped.
+    """
+    keys = run_pipeline.KEY_COLUMNS
+    date = svle["date"]
+    window = ((date >= 0) & (date < 7 * (last_week + 1))).fillna(False).astype(bool)
+    rows = svle.loc[window, keys + ["date", "sum_click"]].astype(
+        {"code_module": object, "code_presentation": object}).dropna(subset=keys)
+    outcomes = info[keys + ["final_result"]].astype(
+        {"code_module": object, "code_presentation": object}).dropna(subset=keys)
+    rows = rows.merge(outcomes, on=keys, how="inner")
+
+    student = rows.groupby(keys, sort=False).ngroup().to_numpy()
+    n_students = int(student.max()) + 1 if len(rows) else 0
+    n_weeks = last_week + 1
+    week = (rows["date"].to_numpy(dtype="float64") // 7).astype(np.int64)
+    cell = student * n_weeks + week
+    clicks_col = rows["sum_click"].to_numpy(dtype="float64", na_value=np.nan)
+
+    def binned(weights=None):
+        flat = np.bincount(cell, weights=weights, minlength=n_students * n_weeks)
+        grid = np.zeros((n_students, n_weeks + 1))
+        grid[:, 1:] = flat.reshape(n_students, n_weeks)
+        return grid.cumsum(axis=1)
+
+    clicks = binned(np.nan_to_num(clicks_col))
+    events = binned()
+    counted = binned(~np.isnan(clicks_col) * 1.0)
+    at_risk = np.zeros(n_students, dtype=bool)
+    at_risk[student[rows["final_result"].isin(AT_RISK_RESULTS).to_numpy()]] = True
+    return clicks, events, counted, at_risk
+
+
+def sweep(svle, info, thresholds, windows):
+    """Flag counts, precision and recall for every threshold × window pair.
+
+    ``windows`` are inclusive ``(first_week, last_week)`` pairs.  A student is
+    in a window with at least one event row in it, and flagged when the
+    window's clicks total under the threshold (all-NULL clicks never flag,
+    as ``SUM() < 50`` is NULL in SQL).
+    """
+    thresholds = np.sort(np.asarray(thresholds))
+    clicks, events, counted, at_risk = weekly_clicks(
+        svle, info, max(last for _, last in windows))
+
+    out = []
+    for first, last in windows:
+        present = events[:, last + 1] - events[:, first] > 0
+        total = clicks[:, last + 1] - clicks[:, first]
+        total = np.where(counted[:, last + 1] - counted[:, first] > 0, total, np.inf)
+        everyone = np.sort(total[present])
+        risky = np.sort(total[present & at_risk])
+        flagged = np.searchsorted(everyone, thresholds, side="left")
+        flagged_risky = np.searchsorted(risky, thresholds, side="left")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(flagged > 0, flagged_risky / flagged, np.nan)
+            recall = np.where(len(risky) > 0, flagged_risky / max(len(risky), 1), np.nan)
+        out.append(pd.DataFrame({
+            "window": f"{first}-{last}",
+            "threshold": thresholds,
+            "students_in_window": len(everyone),
+            "flagged_students": flagged,
+            "flagged_and_at_risk": flagged_risky,
+            "at_risk_students": len(risky),
+            "precision": precision.round(4),
+            "recall": recall.round(4),
+        }))
+    return pd.concat(out, ignore_index=True)[SWEEP_COLUMNS]
+
+
+def _parse_windows(text):
+    windows = []
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        first, last = int(first), int(last or first)
+        if not 0 <= first <= last:
+            raise argparse.ArgumentTypeError(f"bad week window: {part!r}")
+        windows.append((first, last))
+    return windows
+
+
+def _parse_thresholds(text):
+    return [int(t) for t in text.split(",")]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Sweep early-risk click thresholds and week windows in one pass.")
+    parser.add_argument("--thresholds", type=_parse_thresholds, default=DEFAULT_THRESHOLDS,
+                        help="comma-separated click thresholds (default 10,20,…,200)")
+    parser.add_argument("--windows", type=_parse_windows, default=DEFAULT_WINDOWS,
+                        help="comma-separated inclusive week windows, e.g. 0-2,1-3 "
+                             "(default 0-0 … 0-5)")
+    parser.add_argument("--data-dir", type=Path, default=None,
+                        help="directory holding the OULAD CSVs (default: the dataset folder)")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="sweep table path (default: outputs/risk_sweep.csv)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    data_dir = args.data_dir or run_pipeline.DATA_DIR
+    output = args.output or run_pipeline.OUTPUTS / "risk_sweep.csv"
+
+    t0 = time.perf_counter()
+    svle = run_pipeline.read_table("student_vle", data_dir / "studentVle.csv")
+    info = run_pipeline.read_table("student_info", data_dir / "studentInfo.csv")
+    t1 = time.perf_counter()
+    result = sweep(svle, info, args.thresholds, args.windows)
+    t2 = time.perf_counter()
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    result.to_csv(output, index=False)
+    log.info("Swept %d threshold(s) × %d window(s) in %.2f s (read %.2f s)",
+             len(args.thresholds), len(args.windows), t2 - t1, t1 - t0)
+    log.info("Wrote %s (%s rows)", output, f"{len(result):,}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,24 +8,42 @@ This satisfies the "triggered pipeline" requirement for a static dataset:
 dropping a new (or updated) CSV into the watched folder fires the pipeline
 exactly as a real LMS/SIS data-delivery event would.
 
+Filesystem events only enqueue the changed path; a single long-lived worker
+thread runs the pipeline in-process (one interpreter, one warm database
+engine for the life of the watcher).  Changes that arrive while a run is in
+progress are coalesced into exactly one follow-up run, and every run's report
+records the files that triggered it.
+
+Before a run the worker compares each changed file's streamed SHA-256 with a
+manifest of the hashes seen by the last successful run, so a ``touch`` or a
+re-save with identical content is ignored.  For real changes it logs the
+pipeline steps that depend on the file; the run's DAG re-executes only those.
+
 Usage:
     python src/trigger_watcher.py
 
+    # Pipeline options are passed through, e.g.:
+    python src/trigger_watcher.py --backend=pandas --workers=4
+
     # Or run in the background:
     nohup python src/trigger_watcher.py &
 
 Stop with Ctrl-C (or kill the background process).
 """
 
-import subprocess
+import argparse
+import json
 import sys
 import logging
+import threading
 import time
 from pathlib import Path
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+import run_pipeline
+
 # ── Logging ──────────────────────────────────────────────────────────────────
 logging.basicConfig(
     level=logging.INFO,
@@ -37,63 +55,189 @@ log = logging.getLogger("trigger_watcher")
 # ── Paths ─────────────────────────────────────────────────────────────────────
 ROOT = Path(__file__).resolve().parent.parent
 DATA_DIR = ROOT / "open+university+learning+analytics+dataset"
-PIPELINE_SCRIPT = ROOT / "src" / "run_pipeline.py"
 
-# Minimum seconds between pipeline runs (debounce — avoids double-firing
-# when a file-save generates multiple filesystem events).
-DEBOUNCE_SECONDS = 5
+# Seconds without a new event before a run starts, so that a file-save (or a
+# batch delivery of several files) that generates many events fires once.
+SETTLE_SECONDS = 2
 
 
-class DataDirectoryHandler(FileSystemEventHandler):
-    """Fire the pipeline when a CSV file is created or modified."""
+class TriggerQueue:
+    """Changed files waiting for the next run, coalesced.
 
-    def __init__(self):
-        self._last_run = 0.0
+    Any number of events for any number of files between two runs become a
+    single batch; a file that changes twice is listed once.
+    """
 
-    def _should_trigger(self, path: str) -> bool:
-        return path.endswith(".csv")
+    def __init__(self, settle=SETTLE_SECONDS):
+        self.settle = settle
+        self._cond = threading.Condition()
+        self._pending = {}   # path -> reason of its first event
+        self._last_event = 0.0
+        self._closed = False
+
+    def put(self, path, reason):
+        with self._cond:
+            self._pending.setdefault(path, reason)
+            self._last_event = time.monotonic()
+            self._cond.notify_all()
+
+    def take(self):
+        """Block until a batch has settled; return ``{path: reason}`` (None once closed)."""
+        with self._cond:
+            while not self._closed:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                quiet = time.monotonic() - self._last_event
+                if quiet >= self.settle:
+                    batch, self._pending = self._pending, {}
+                    return batch
+                self._cond.wait(self.settle - quiet)
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class ContentManifest:
+    """SHA-256 of each CSV's content as of the last successful run it triggered."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.hashes = json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    def changed(self, paths):
+        """``{path: sha256}`` of those ``paths`` whose content differs from the manifest."""
+        out = {}
+        for p in map(Path, paths):
+            if not p.exists():
+                continue
+            # Streamed in 1 MiB blocks; shared with the pipeline's own DAG
+            # signatures, so the run does not hash the file again.
+            sha = run_pipeline.file_fingerprint(p)["sha256"]
+            if self.hashes.get(p.name) != sha:
+                out[str(p)] = sha
+        return out
+
+    def update(self, hashes):
+        self.hashes.update({Path(p).name: sha for p, sha in hashes.items()})
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        run_pipeline._write_json(self.path, self.hashes)
 
-    def _trigger_pipeline(self, reason: str):
-        now = time.time()
-        if now - self._last_run < DEBOUNCE_SECONDS:
-            log.debug("Debounce — skipping duplicate event (%s)", reason)
-            return
 
-        self._last_run = now
-        log.info("TRIGGER fired: %s", reason)
-        log.info("Starting pipeline: %s", PIPELINE_SCRIPT)
+def affected_steps(pipeline_args, files):
+    """Pipeline DAG nodes that a change to ``files`` re-runs, in run order."""
+    if pipeline_args.backend == "pandas":
+        backend = run_pipeline.PandasBackend()
+    else:
+        backend = run_pipeline.MySQLBackend(None)  # only for the DAG's shape
+    return run_pipeline.affected_nodes(run_pipeline.build_dag(backend, pipeline_args), files)
 
-        result = subprocess.run(
-            [sys.executable, str(PIPELINE_SCRIPT)],
-            capture_output=False,   # let pipeline logs print to console
-        )
 
-        if result.returncode == 0:
-            log.info("Pipeline completed successfully.")
-        else:
-            log.error("Pipeline exited with code %d — check logs above.", result.returncode)
+class PipelineWorker(threading.Thread):
+    """Runs the pipeline once per settled batch from ``queue``, in-process.
+
+    The mysql engine is built on the first run and reused by every later one
+    (``pool_pre_ping`` replaces connections that went stale in between).
+    With a ``manifest``, batches whose content did not change are dropped.
+    """
+
+    def __init__(self, queue, pipeline_argv=(), run=None, manifest=None):
+        super().__init__(name="pipeline-worker", daemon=True)
+        self.queue = queue
+        self.pipeline_argv = list(pipeline_argv)
+        self.run_pipeline = run or run_pipeline.main
+        self.manifest = manifest
+        self.engine = None
+
+    def _warm_engine(self):
+        args = run_pipeline.parse_args(self.pipeline_argv)
+        if args.backend == "mysql" and self.engine is None:
+            self.engine = run_pipeline.build_engine(local_infile=args.load_mode == "bulk",
+                                                    pool_size=max(5, args.workers))
+        return self.engine
+
+    def run(self):
+        while True:
+            batch = self.queue.take()
+            if batch is None:
+                return
+            hashes = None
+            if self.manifest is not None:
+                hashes = self.manifest.changed(batch)
+                for path in batch.keys() - hashes.keys():
+                    log.info("Ignoring %s — content unchanged", Path(path).name)
+                batch = {p: batch[p] for p in hashes}
+                if not batch:
+                    continue
+            triggers = sorted(Path(p).name for p in batch)
+            for reason in batch.values():
+                log.info("TRIGGER fired: %s", reason)
+            steps = affected_steps(run_pipeline.parse_args(self.pipeline_argv), triggers)
+            log.info("Steps affected (%d): %s", len(steps), ", ".join(steps) or "none")
+            t0 = time.perf_counter()
+            try:
+                self.run_pipeline(self.pipeline_argv, engine=self._warm_engine(),
+                                  triggers=triggers)
+                if hashes:
+                    self.manifest.update(hashes)
+                log.info("Pipeline completed successfully in %.1f s (triggered by %s).",
+                         time.perf_counter() - t0, ", ".join(triggers))
+            except Exception as exc:
+                log.error("Pipeline FAILED after %.1f s: %s — check logs above.",
+                          time.perf_counter() - t0, exc)
+
+
+class DataDirectoryHandler(FileSystemEventHandler):
+    """Enqueue CSV files that are created, modified or moved into place."""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def _should_trigger(self, path: str) -> bool:
+        return path.endswith(".csv")
 
     # ── Watchdog event hooks ──────────────────────────────────────────────────
     def on_created(self, event):
         if not event.is_directory and self._should_trigger(event.src_path):
-            self._trigger_pipeline(f"new file: {event.src_path}")
+            self.queue.put(event.src_path, f"new file: {event.src_path}")
 
     def on_modified(self, event):
         if not event.is_directory and self._should_trigger(event.src_path):
-            self._trigger_pipeline(f"modified file: {event.src_path}")
+            self.queue.put(event.src_path, f"modified file: {event.src_path}")
+
+    def on_moved(self, event):
+        # Editors and copy tools often write to a temp file, then rename it.
+        if not event.is_directory and self._should_trigger(event.dest_path):
+            self.queue.put(event.dest_path, f"replaced file: {event.dest_path}")
+
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Watch the data directory and run the pipeline on CSV changes. "
+                    "Other options are passed to run_pipeline.py.")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help=f"quiet seconds before a run starts (default {SETTLE_SECONDS})")
+    args, pipeline_argv = parser.parse_known_args(argv)
+    pipeline_args = run_pipeline.parse_args(pipeline_argv)
+    data_dir = pipeline_args.data_dir or DATA_DIR
+    outputs = pipeline_args.output_dir or run_pipeline.OUTPUTS
 
-def main():
-    if not DATA_DIR.exists():
-        log.error("Data directory not found: %s", DATA_DIR)
+    if not data_dir.exists():
+        log.error("Data directory not found: %s", data_dir)
         sys.exit(1)
 
-    handler = DataDirectoryHandler()
+    queue = TriggerQueue(settle=args.settle)
+    manifest = ContentManifest(outputs / f"watch_manifest_{pipeline_args.backend}.json")
+    worker = PipelineWorker(queue, pipeline_argv, manifest=manifest)
+    worker.start()
     observer = Observer()
-    observer.schedule(handler, str(DATA_DIR), recursive=False)
+    observer.schedule(DataDirectoryHandler(queue), str(data_dir), recursive=False)
     observer.start()
 
-    log.info("Watching for CSV changes in: %s", DATA_DIR)
+    log.info("Watching for CSV changes in: %s", data_dir)
     log.info("Press Ctrl-C to stop.")
 
     try:
@@ -104,6 +248,8 @@ def main():
         observer.stop()
 
     observer.join()
+    queue.close()
+    worker.join()  # lets a run in progress finish
 
 
 if __name__ == "__main__":
@@ -5,6 +5,11 @@ Integration tests use a real MySQL connection (credentials from .env or
 environment variables).  Unit tests run entirely in memory with synthetic data.
 """
 import os
+import re
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
 import pytest
 import pandas as pd
 from dotenv import load_dotenv
@@ -12,6 +17,8 @@ from sqlalchemy import create_engine
 
 load_dotenv()
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
 
 # ── Engine fixture (integration tests only) ──────────────────────────────────
 @pytest.fixture(scope="session")
@@ -27,6 +34,78 @@ def engine():
     eng.dispose()
 
 
+# ── Recorded-SQL stand-in (unit tests) ───────────────────────────────────────
+class RecordingEngine:
+    """Engine stand-in that records every statement instead of executing it.
+
+    ``LOAD DATA LOCAL INFILE`` statements also capture the contents of the
+    referenced file, since the loader deletes its temp files afterwards.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.infiles = []
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+    connect = begin
+
+    def execute(self, stmt, params=None):
+        sql = str(stmt)
+        self.statements.append(sql)
+        m = re.search(r"LOCAL INFILE '([^']+)'", sql)
+        if m:
+            self.infiles.append(Path(m.group(1)).read_text())
+        return RecordedResult()
+
+
+class RecordedResult:
+    def scalar(self):
+        return 0
+
+    def fetchall(self):
+        return []
+
+
+@pytest.fixture(autouse=True)
+def _isolated_extract_cache(tmp_path_factory, monkeypatch):
+    """Keep the extract cache of every test out of the working tree."""
+    import run_pipeline
+
+    cache = tmp_path_factory.mktemp("extract_cache")
+    monkeypatch.setattr(run_pipeline, "CACHE_DIR", cache)
+    monkeypatch.setattr(run_pipeline, "CACHE_INDEX", cache / "index.json")
+    return cache
+
+
+@pytest.fixture
+def recording_engine():
+    return RecordingEngine()
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Empty OULAD-shaped data directory patched in as run_pipeline.DATA_DIR."""
+    import run_pipeline
+
+    for fname in [*run_pipeline.RAW_FILES.values(), "studentVle.csv"]:
+        (tmp_path / fname).write_text("")
+    monkeypatch.setattr(run_pipeline, "DATA_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def oulad_dir(tmp_path_factory):
+    """A small seeded synthetic OULAD dataset (~1/500 of the real size)."""
+    import generate_oulad
+
+    path = tmp_path_factory.mktemp("oulad")
+    generate_oulad.generate(path, scale=0.002, seed=11)
+    return path
+
+
 # ── Synthetic DataFrames (unit tests) ────────────────────────────────────────
 @pytest.fixture
 def mini_vle():
@@ -7,8 +7,29 @@ Integration tests: query MySQL; require a running DB with pipeline already run.
                      pytest -m "not integration"
 """
 import io
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
 import pytest
 import pandas as pd
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.dialects.mysql import mysqlconnector
+
+import benchmark
+import engagement_store
+import generate_oulad
+import review_service
+import risk_sweep
+import run_pipeline
+import trigger_watcher
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -100,6 +121,1770 @@ def test_clicks_non_negative(mini_vle):
     assert (mini_vle["sum_click"] >= 0).all()
 
 
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — bulk loader (recorded-SQL stand-in, no database)
+# ═══════════════════════════════════════════════════════════════════
+
+SVLE_CSV = (
+    "code_module,code_presentation,id_student,id_site,date,sum_click\r\n"
+    "AAA,2013J,1,10,0,30\r\n"
+    "AAA,2013J,1,10,?,20\r\n"
+    "AAA,2013J,2,11,0,\r\n"
+)
+
+
+def test_bulk_load_chunks_and_progress(tmp_path, monkeypatch, recording_engine):
+    """Bulk mode issues one LOAD DATA per CHUNK_SIZE rows, header stripped."""
+    path = tmp_path / "studentVle.csv"
+    path.write_bytes(SVLE_CSV.encode())
+    monkeypatch.setattr(run_pipeline, "CHUNK_SIZE", 2)
+
+    total = run_pipeline.load_student_vle(recording_engine, path, mode="bulk")
+
+    assert total == 3
+    assert recording_engine.infiles == [
+        "AAA,2013J,1,10,0,30\nAAA,2013J,1,10,?,20\n",
+        "AAA,2013J,2,11,0,\n",
+    ]
+    assert not list(Path(tempfile.gettempdir()).glob("student_vle_*.csv"))
+
+
+def test_bulk_load_sql_maps_na_values():
+    """Every column is NULLIF-ed against '?' and '' like read_csv(na_values)."""
+    sql = run_pipeline._load_data_sql("/tmp/x.csv", "student_vle",
+                                      run_pipeline.STUDENT_VLE_COLUMNS)
+    assert "LOAD DATA LOCAL INFILE '/tmp/x.csv' INTO TABLE student_vle" in sql
+    for col in run_pipeline.STUDENT_VLE_COLUMNS:
+        assert f"{col} = NULLIF(NULLIF(@{col}, '?'), '')" in sql
+
+
+@pytest.mark.parametrize("profile", ["indexed", "deferred"])
+def test_load_profile_orders_index_build(profile, recording_engine, data_dir):
+    """indexed: ALTER before the first row; deferred: one ALTER after the last."""
+    (data_dir / "studentVle.csv").write_bytes(SVLE_CSV.encode())
+
+    run_pipeline.load(recording_engine, {}, mode="bulk", profile=profile)
+
+    stmts = recording_engine.statements
+    alter = [i for i, s in enumerate(stmts) if s.startswith("ALTER TABLE student_vle")]
+    loads = [i for i, s in enumerate(stmts) if "LOAD DATA" in s]
+    assert len(alter) == 1 and loads
+    assert (alter[0] < loads[0]) if profile == "indexed" else (alter[0] > loads[-1])
+    for name, cols in run_pipeline.LOAD_PROFILES[profile].items():
+        assert f"ADD INDEX {name} ({cols})" in stmts[alter[0]]
+    assert not any("INDEX" in s for s in stmts if s.startswith("CREATE TABLE"))
+
+
+def test_unknown_load_mode_rejected(recording_engine):
+    with pytest.raises(ValueError):
+        run_pipeline.load_student_vle(recording_engine, "unused.csv", mode="copy")
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — concurrent loader
+# ═══════════════════════════════════════════════════════════════════
+
+def _fake_chunks(n, produced):
+    for i in range(n):
+        produced.append(i)
+        yield pd.DataFrame({"chunk": [i]})
+
+
+def test_concurrent_load_bounds_chunks_in_memory(monkeypatch, recording_engine, data_dir):
+    """Never more than `workers` chunks are read ahead of finished inserts."""
+    produced, written, high_water = [], [], []
+    lock = threading.Lock()
+
+    def write(engine, chunk, mode, checkpoint=None, dim=None):
+        time.sleep(0.01)
+        with lock:
+            high_water.append(len(produced) - len(written))
+            written.append(chunk)
+        return 1
+
+    monkeypatch.setattr(run_pipeline, "_load_table", lambda *a: None)
+    monkeypatch.setattr(run_pipeline, "_student_vle_chunks",
+                        lambda path, mode, end=None: _fake_chunks(12, produced))
+    monkeypatch.setattr(run_pipeline, "_write_student_vle_chunk", write)
+
+    run_pipeline.load(recording_engine, {"courses": pd.DataFrame()}, workers=3)
+
+    assert len(written) == 12
+    assert max(high_water) <= 3
+
+
+@pytest.mark.parametrize("resume", [False, True])
+def test_concurrent_load_failure_aborts(resume, monkeypatch, recording_engine, data_dir):
+    """A failed chunk stops the stage and re-raises.  A fresh load is rolled
+    back; a resumed one keeps its committed chunks for the next --resume."""
+    produced = []
+
+    def write(engine, chunk, mode, checkpoint=None, dim=None):
+        if chunk["chunk"].iloc[0] in (4, 7):
+            raise OSError("connection lost")
+        return 1
+
+    monkeypatch.setattr(run_pipeline, "_load_table", lambda *a: None)
+    monkeypatch.setattr(run_pipeline, "_student_vle_chunks",
+                        lambda path, mode, end=None: _fake_chunks(50, produced))
+    monkeypatch.setattr(run_pipeline, "_write_student_vle_chunk", write)
+
+    with pytest.raises(RuntimeError, match="student_vle chunk 05 failed"):
+        run_pipeline.load(recording_engine, {}, workers=2, resume=resume)
+
+    assert len(produced) < 50
+    # (the first DELETE is the full load clearing old checkpoints as it starts)
+    deletes = [s for s in recording_engine.statements
+               if s.startswith("DELETE") and "pipeline_state" not in s][1:]
+    rolled_back = [f"DELETE FROM {t}" for t in run_pipeline.RAW_TABLES] + [
+        "DELETE FROM pipeline_checkpoint"]
+    assert deletes == ([] if resume else rolled_back)
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — incremental ingestion watermarks
+# ═══════════════════════════════════════════════════════════════════
+
+def _watermark(path):
+    end = path.stat().st_size
+    return {"byte_offset": end, "row_count": 3,
+            "check_hash": run_pipeline._prefix_hash(path, end, run_pipeline.WATERMARK_WINDOW)}
+
+
+def test_watermark_resumes_after_append(tmp_path):
+    """Only rows appended after the watermark are read back."""
+    path = tmp_path / "studentVle.csv"
+    path.write_bytes(SVLE_CSV.encode())
+    mark = _watermark(path)
+    with open(path, "ab") as f:
+        f.write(b"BBB,2014J,9,12,3,7\r\n")
+
+    offset = run_pipeline._valid_offset(path, mark)
+    assert offset == mark["byte_offset"]
+
+    new = pd.concat(run_pipeline._student_vle_chunks(path, "pandas", offset))
+    assert new.to_dict("records") == [{
+        "code_module": "BBB", "code_presentation": "2014J", "id_student": 9,
+        "id_site": 12, "date": 3, "sum_click": 7,
+    }]
+    tmp_file, n = next(run_pipeline._student_vle_chunks(path, "bulk", offset))
+    assert (n, tmp_file.read_text()) == (1, "BBB,2014J,9,12,3,7\n")
+    tmp_file.unlink()
+
+
+def test_watermark_rejected_after_rewrite(tmp_path):
+    """A rewritten or truncated file forces a full reload."""
+    path = tmp_path / "studentVle.csv"
+    path.write_bytes(SVLE_CSV.encode())
+    mark = _watermark(path)
+
+    path.write_bytes(SVLE_CSV.replace("30", "31").encode())
+    assert run_pipeline._valid_offset(path, mark) is None
+    path.write_bytes(SVLE_CSV[:40].encode())
+    assert run_pipeline._valid_offset(path, mark) is None
+    assert run_pipeline._valid_offset(path, None) is None
+
+
+def test_watermark_covers_only_complete_lines_read(tmp_path):
+    """A half-written last line is neither loaded nor counted as read."""
+    path = tmp_path / "studentVle.csv"
+    path.write_bytes(SVLE_CSV.encode())
+    complete = path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(b"BBB,2014J,9,1")
+
+    end, check_hash = run_pipeline.vle_snapshot(path)
+    assert end == complete
+    assert check_hash == run_pipeline._prefix_hash(path, end, run_pipeline.WATERMARK_WINDOW)
+    rows = pd.concat(run_pipeline._student_vle_chunks(path, "pandas", 0, end))
+    assert "BBB" not in set(rows["code_module"])
+    tmp_file, n = next(run_pipeline._student_vle_chunks(path, "bulk", 0, end))
+    assert b"BBB" not in tmp_file.read_bytes()
+    tmp_file.unlink()
+
+    # The rest of the line arrives: the next run starts at the stored end.
+    with open(path, "ab") as f:
+        f.write(b"2,3,7\r\n")
+    offset = run_pipeline._valid_offset(path, {"byte_offset": end, "check_hash": check_hash})
+    new = pd.concat(run_pipeline._student_vle_chunks(path, "pandas", offset))
+    assert new[["code_module", "id_site", "sum_click"]].values.tolist() == [["BBB", 12, 7]]
+
+
+def test_load_records_the_fingerprint_of_what_was_read(monkeypatch, recording_engine,
+                                                       data_dir):
+    """Watermarks carry the extract-time fingerprint, not the file's current one."""
+    saved = {}
+    monkeypatch.setattr(run_pipeline, "_load_table", lambda *a: None)
+    monkeypatch.setattr(run_pipeline, "_save_watermark",
+                        lambda conn, source, n, end, h: saved.update({source: (end, h)}))
+    (data_dir / "courses.csv").write_text("changed after extract\n")
+    (data_dir / "studentVle.csv").write_bytes(SVLE_CSV.encode() + b"AAA,2013J,")
+
+    run_pipeline.load(recording_engine, {"courses": pd.DataFrame()}, mode="bulk",
+                      sources={"courses": {"size": 10, "sha256": "at-extract"}})
+
+    end = len(SVLE_CSV.encode())
+    assert saved["courses.csv"] == (10, "at-extract")
+    assert saved["studentVle.csv"] == (end, run_pipeline._prefix_hash(
+        data_dir / "studentVle.csv", end, run_pipeline.WATERMARK_WINDOW))
+    assert "AAA,2013J,\n" not in recording_engine.infiles[-1]
+
+
+def _load_engine(tmp_path, monkeypatch):
+    """SQLite engine load() can run on: MySQL-only DDL is rewritten or skipped."""
+    eng = create_engine(f"sqlite:///{tmp_path / 'load.db'}")
+
+    @event.listens_for(eng, "connect")
+    def _now(dbapi_conn, _):
+        dbapi_conn.create_function("NOW", 0, lambda: "2024-01-01 00:00:00")
+
+    @event.listens_for(eng, "before_cursor_execute", retval=True)
+    def _sqlite_ddl(conn, cursor, statement, parameters, context, executemany):
+        statement = re.sub(r"\)\s*PARTITION BY KEY \([^)]*\) PARTITIONS \d+", ")", statement)
+        statement = re.sub(r"CREATE TABLE (IF NOT EXISTS )?(\w+) LIKE (\w+)",
+                           r"CREATE TABLE \1\2 AS SELECT * FROM \3 WHERE 0", statement)
+        return statement, parameters
+
+    monkeypatch.setattr(run_pipeline, "build_indexes", lambda *a: None)
+    return eng
+
+
+def _raw_frames(data_dir, oulad_dir):
+    for f in oulad_dir.iterdir():
+        (data_dir / f.name).write_bytes(f.read_bytes())
+    return {name: run_pipeline.read_table(name, data_dir / fname)
+            for name, fname in run_pipeline.RAW_FILES.items()}
+
+
+def _cut_off_after(monkeypatch, chunks):
+    """Make student_vle inserts fail once ``chunks`` chunks have been written."""
+    write = run_pipeline._write_student_vle_chunk
+    written = []
+
+    def failing(*args, **kwargs):
+        if len(written) == chunks:
+            raise OSError("connection lost")
+        written.append(1)
+        return write(*args, **kwargs)
+
+    monkeypatch.setattr(run_pipeline, "CHUNK_SIZE", 5_000)
+    monkeypatch.setattr(run_pipeline, "_write_student_vle_chunk", failing)
+    return lambda: monkeypatch.setattr(run_pipeline, "_write_student_vle_chunk", write)
+
+
+def _count(engine, table):
+    with engine.connect() as conn:
+        return conn.execute(run_pipeline.text(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+
+def test_interrupted_full_refresh_leaves_no_watermarks(tmp_path, monkeypatch, data_dir,
+                                                       oulad_dir):
+    """A plain run after a cut-off full refresh reloads instead of appending."""
+    eng = _load_engine(tmp_path, monkeypatch)
+    frames = _raw_frames(data_dir, oulad_dir)
+    assert run_pipeline.load(eng, frames) == "full"
+    total = _count(eng, "student_vle")
+
+    restore = _cut_off_after(monkeypatch, 2)
+    with pytest.raises(OSError):
+        run_pipeline.load(eng, frames)
+    restore()
+    assert run_pipeline.read_watermarks(eng) == {}
+    assert _count(eng, "student_vle") == 10_000
+
+    assert run_pipeline.load(eng, frames, full_refresh=False) == "full"
+    assert _count(eng, "student_vle") == total
+
+
+def test_plain_run_resumes_an_interrupted_full_load(tmp_path, monkeypatch, data_dir,
+                                                    oulad_dir):
+    """A run without --full-refresh/--resume does not append to a half-done load."""
+    eng = _load_engine(tmp_path, monkeypatch)
+    frames = _raw_frames(data_dir, oulad_dir)
+    restore = _cut_off_after(monkeypatch, 2)
+    with pytest.raises(OSError):
+        run_pipeline.load(eng, frames)
+    restore()
+
+    written = []
+    write = run_pipeline._write_student_vle_chunk
+    monkeypatch.setattr(run_pipeline, "_write_student_vle_chunk",
+                        lambda *a, **k: written.append(1) or write(*a, **k))
+    assert run_pipeline.load(eng, frames, full_refresh=False) == "full"
+    rows = len((data_dir / "studentVle.csv").read_bytes().splitlines()) - 1
+    assert len(written) == -(-rows // 5_000) - 2
+    assert _count(eng, "student_vle") == rows
+    assert run_pipeline.load(eng, frames, full_refresh=False) == "incremental"
+
+
+def test_incremental_load_checks_row_counts(tmp_path, monkeypatch, data_dir, oulad_dir):
+    """Tables that lost rows since their watermark was written are reloaded."""
+    eng = _load_engine(tmp_path, monkeypatch)
+    frames = _raw_frames(data_dir, oulad_dir)
+    run_pipeline.load(eng, frames)
+    total = _count(eng, "student_vle")
+    assert run_pipeline.load(eng, frames, full_refresh=False) == "incremental"
+
+    with eng.begin() as conn:
+        conn.execute(run_pipeline.text("DELETE FROM student_vle WHERE id_student % 2 = 0"))
+    assert run_pipeline.load(eng, frames, full_refresh=False) == "full"
+    assert _count(eng, "student_vle") == total
+
+
+def test_full_load_drops_derived_views(tmp_path, monkeypatch, data_dir, oulad_dir):
+    eng = _load_engine(tmp_path, monkeypatch)
+    frames = _raw_frames(data_dir, oulad_dir)
+    run_pipeline.load(eng, frames)
+    for view in run_pipeline.DERIVED_VIEWS:
+        run_pipeline.create_view(eng, view, f"CREATE VIEW {view} AS SELECT * FROM student_vle")
+    assert run_pipeline.load(eng, frames) == "full"
+    assert not set(run_pipeline.inspect(eng).get_view_names()) & run_pipeline.DERIVED_VIEWS
+
+
+def test_upsert_updates_non_key_columns_only():
+    sql = run_pipeline._upsert_sql("courses", "_stage_courses",
+                                   ["code_module", "code_presentation",
+                                    "module_presentation_length"],
+                                   run_pipeline.PRIMARY_KEYS["courses"])
+    assert sql.endswith("ON DUPLICATE KEY UPDATE "
+                        "module_presentation_length = new.module_presentation_length")
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — incremental transforms (SQLite stand-in for MySQL)
+# ═══════════════════════════════════════════════════════════════════
+
+def _svle(rows):
+    return pd.DataFrame(rows, columns=run_pipeline.STUDENT_VLE_COLUMNS)
+
+
+def _info(results):
+    return pd.DataFrame(
+        [(m, p, s, r) for (m, p, s), r in results.items()],
+        columns=["code_module", "code_presentation", "id_student", "final_result"],
+    )
+
+
+def _no_assessments():
+    return {t: pd.DataFrame({c: pd.Series(dtype=d) for c, d in run_pipeline.SCHEMA[t].items()})
+            for t in ["assessments", "student_assessment"]}
+
+
+def _sqlite(tmp_path, name, tables):
+    """``tables`` in a SQLite file; the assessment tables default to empty."""
+    eng = create_engine(f"sqlite:///{tmp_path / name}")
+
+    @event.listens_for(eng, "connect")
+    def _floor(dbapi_conn, _):
+        # SQLAlchemy's built-in floor() shim raises on NULL; MySQL returns NULL.
+        dbapi_conn.create_function(
+            "floor", 1, lambda x: None if x is None else math.floor(x), deterministic=True)
+
+    for tbl, df in {**_no_assessments(), **tables}.items():
+        df.to_sql(tbl, eng, index=False)
+    return eng
+
+
+def _derived(engine):
+    out = {}
+    for name, _ in run_pipeline.TRANSFORMS:
+        df = pd.read_sql(f"SELECT * FROM {name}", engine)
+        keys = [c for c in ["code_module", "code_presentation", "id_student", "week_num"]
+                if c in df.columns]
+        out[name] = df.sort_values(keys).reset_index(drop=True)
+    return out
+
+
+def test_incremental_transforms_match_full_rebuild(tmp_path):
+    base = _svle([
+        ("AAA", "2013J", 1, 10, 0, 30), ("AAA", "2013J", 1, 10, 8, 20),
+        ("AAA", "2013J", 2, 11, 1, 60), ("AAA", "2013J", 3, 11, 15, 5),
+        ("BBB", "2014B", 4, 12, 2, 40), ("BBB", "2014B", 5, 12, 3, 90),
+        ("CCC", "2014J", 6, 13, 4, 10),
+    ])
+    delta = _svle([
+        ("AAA", "2013J", 1, 10, 2, 25),    # existing group, week 0
+        ("AAA", "2013J", 3, 11, 30, 100),  # new week outside the early window
+        ("BBB", "2014B", 7, 12, 0, 5),     # new student
+        ("BBB", "2014B", 4, 12, 16, 15),   # pushes student 4 over the threshold
+    ])
+    before = {("AAA", "2013J", 1): "Pass", ("AAA", "2013J", 2): "Pass",
+              ("AAA", "2013J", 3): "Fail", ("BBB", "2014B", 4): "Withdrawn",
+              ("BBB", "2014B", 5): "Pass", ("CCC", "2014J", 6): "Pass"}
+    after = {**before, ("BBB", "2014B", 7): "Fail", ("CCC", "2014J", 6): "Fail"}
+    changed = _info({k: v for k, v in after.items() if before.get(k) != v})
+
+    inc = _sqlite(tmp_path, "inc.db", {"student_vle": base, "student_info": _info(before)})
+    run_pipeline.transform(inc)
+    pd.concat([base, delta]).to_sql("student_vle", inc, index=False, if_exists="replace")
+    _info(after).to_sql("student_info", inc, index=False, if_exists="replace")
+    delta.to_sql("student_vle_delta", inc, index=False)
+    changed.drop(columns="final_result").to_sql("student_info_delta", inc, index=False)
+    run_pipeline.transform(inc, incremental=True)
+
+    full = _sqlite(tmp_path, "full.db", {"student_vle": pd.concat([base, delta]),
+                                         "student_info": _info(after)})
+    run_pipeline.transform(full)
+
+    got, want = _derived(inc), _derived(full)
+    for name in want:
+        pd.testing.assert_frame_equal(got[name], want[name], check_dtype=False, obj=name)
+    assert got["early_risk_flags"].set_index("id_student").loc[4, "low_engagement_flag"] == 0
+    assert got["instructor_review_queue"].set_index("id_student").loc[7, "engagement_rank"] == 1
+
+
+def test_deltas_are_cleared_only_after_every_incremental_transform(tmp_path):
+    eng = _sqlite(tmp_path, "d.db", {
+        "student_vle": _svle([("AAA", "2013J", 1, 10, 0, 30)]),
+        "student_info": _info({("AAA", "2013J", 1): "Pass"}),
+    })
+    run_pipeline.transform(eng)
+    _svle([("AAA", "2013J", 1, 10, 9, 5)]).to_sql("student_vle_delta", eng, index=False)
+    _info({}).drop(columns="final_result").to_sql("student_info_delta", eng, index=False)
+
+    backend = run_pipeline.MySQLBackend(eng)
+    nodes = {n.name: n for n in run_pipeline.build_dag(backend, run_pipeline.parse_args([]))}
+    assert set(nodes["clear_deltas"].reads) == set(dict(run_pipeline.INCREMENTAL_TRANSFORMS))
+    # Finishing the last transform no longer empties the deltas ...
+    for name in run_pipeline.DERIVED_TABLES:
+        backend.transform_one(name, incremental=True)
+    assert len(pd.read_sql("SELECT * FROM student_vle_delta", eng)) == 1
+    nodes["clear_deltas"].func()
+    assert len(pd.read_sql("SELECT * FROM student_vle_delta", eng)) == 0
+    # ... and a rebuild of some presentations keeps them.
+    args = run_pipeline.parse_args(["--presentation", "2013J"])
+    assert "clear_deltas" not in {n.name for n in run_pipeline.build_dag(backend, args)}
+
+
+def test_presentation_rebuild_is_not_recorded_as_a_full_run(tmp_path, data_dir):
+    """After a --presentation run the next default run re-runs every transform."""
+    backend = run_pipeline.MySQLBackend(_sqlite(tmp_path, "p.db", {}))
+
+    def signatures(argv):
+        return run_pipeline._dag_signatures(
+            run_pipeline.build_dag(backend, run_pipeline.parse_args(argv)))
+
+    full, some = signatures([]), signatures(["--presentation", "2013J"])
+    assert full["load"] == some["load"]
+    changed = {n for n in some if full[n] != some[n]}
+    assert {f"transform:{t}" for t in run_pipeline.DERIVED_TABLES} | {"score"} <= changed
+
+
+def test_incremental_transform_falls_back_without_derived_tables(tmp_path):
+    eng = _sqlite(tmp_path, "fresh.db", {
+        "student_vle": _svle([("AAA", "2013J", 1, 10, 0, 30)]),
+        "student_info": _info({("AAA", "2013J", 1): "Pass"}),
+    })
+    run_pipeline.transform(eng, incremental=True)
+    assert len(pd.read_sql("SELECT * FROM instructor_review_queue", eng)) == 1
+
+
+def test_early_risk_flags_read_the_window_without_materializing_outcomes(tmp_path):
+    vle = _svle([
+        ("AAA", "2013J", 1, 10, -1, 500), ("AAA", "2013J", 1, 10, 0, 30),
+        ("AAA", "2013J", 1, 10, 20, 15), ("AAA", "2013J", 1, 10, 21, 900),
+        ("AAA", "2013J", 2, 11, 6, 70), ("AAA", "2013J", 9, 11, 3, 10),
+    ])
+    # REAL dates make SQLite's date / 7 a true division, like MySQL's.
+    eng = _sqlite(tmp_path, "fused.db", {
+        "student_vle": vle.astype({"date": "float64"}),
+        "student_info": _info({("AAA", "2013J", 1): "Fail", ("AAA", "2013J", 2): "Pass"}),
+        # left by a run from before engagement_with_outcomes became a view
+        "engagement_with_outcomes": pd.DataFrame({"x": [1]}),
+    })
+    run_pipeline.transform(eng)
+    assert run_pipeline.inspect(eng).get_view_names() == ["engagement_with_outcomes"]
+
+    erf = _derived(eng)["early_risk_flags"].set_index("id_student")
+    assert erf["clicks_weeks_0_2"].to_dict() == {1: 45, 2: 70}
+    assert erf["low_engagement_flag"].to_dict() == {1: 1, 2: 0}
+    # The view still answers the old query with the same result.
+    old = pd.read_sql("SELECT id_student, SUM(total_clicks) AS c FROM engagement_with_outcomes "
+                      "WHERE week_num BETWEEN 0 AND 2 GROUP BY id_student", eng)
+    assert dict(zip(old["id_student"], old["c"])) == {1: 45, 2: 70}
+
+
+def test_partitioned_transforms_match_full_rebuild(tmp_path):
+    vle = _svle([
+        ("AAA", "2013J", 1, 10, 0, 30), ("AAA", "2013J", 2, 10, 3, 70),
+        ("AAA", "2014J", 1, 10, 1, 10), ("BBB", "2014J", 3, 12, 9, 45),
+        ("BBB", "2014B", 4, 12, 2, 60), ("BBB", "2014B", 5, 12, 22, 90),
+        ("CCC", None, 6, 13, 4, 10),
+    ])
+    info = _info({("AAA", "2013J", 1): "Pass", ("AAA", "2013J", 2): "Fail",
+                  ("AAA", "2014J", 1): "Withdrawn", ("BBB", "2014J", 3): "Pass",
+                  ("BBB", "2014B", 4): "Fail", ("BBB", "2014B", 5): "Pass"})
+    full = _sqlite(tmp_path, "full.db", {"student_vle": vle, "student_info": info})
+    run_pipeline.transform(full)
+    part = _sqlite(tmp_path, "part.db", {"student_vle": vle, "student_info": info})
+    run_pipeline.transform(part, workers=3)
+
+    got, want = _derived(part), _derived(full)
+    for name in want:
+        pd.testing.assert_frame_equal(got[name], want[name], check_dtype=False, obj=name)
+
+    # A correction to 2014B rebuilds only that presentation's rows.
+    with part.begin() as conn:
+        conn.execute(run_pipeline.text(
+            "UPDATE student_vle SET sum_click = 5 WHERE code_presentation = '2014B'"))
+        conn.execute(run_pipeline.text(
+            "UPDATE instructor_review_queue SET engagement_rank = 99 "
+            "WHERE code_presentation = '2014J'"))
+    run_pipeline.transform(part, presentations=["2014B"])
+    irq = _derived(part)["instructor_review_queue"].set_index("id_student")
+    assert irq.loc[4, "low_engagement_flag"] == 1
+    assert irq.loc[3, "engagement_rank"] == 99
+
+
+def test_partitioned_rebuild_skips_delete_on_fresh_table(tmp_path, monkeypatch):
+    """Only a rebuild of listed presentations deletes their old rows first."""
+    vle = _svle([("AAA", "2013J", 1, 10, 0, 30), ("AAA", "2014J", 1, 10, 1, 10),
+                 ("BBB", "2014J", 2, 11, 1, 10)])
+    engine = _sqlite(tmp_path, "part.db", {"student_vle": vle})
+    blocks = []
+    run_sql_block = run_pipeline.run_sql_block
+
+    def record(engine, sql, params=None):
+        blocks.append(sql)
+        run_sql_block(engine, sql, params)
+
+    monkeypatch.setattr(run_pipeline, "run_sql_block", record)
+    run_pipeline.transform_partitioned(engine, "fact_weekly_engagement", workers=2)
+    assert not any("DELETE" in b for b in blocks)
+    # One block per (code_module, code_presentation), after the CREATE TABLE.
+    assert len(blocks) == 1 + 3
+
+    blocks.clear()
+    run_pipeline.transform_partitioned(engine, "fact_weekly_engagement",
+                                       presentations=["2014J"])
+    assert [b.lstrip().split()[0] for b in blocks] == ["DELETE"]
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — health checks (SQLite stand-in for MySQL)
+# ═══════════════════════════════════════════════════════════════════
+
+def _health_db(tmp_path, name):
+    raw = {t: pd.DataFrame({"x": [1]}) for t in run_pipeline.RAW_FILES
+           if t not in _no_assessments()}
+    eng = _sqlite(tmp_path, name, {
+        **raw,
+        "student_vle": _svle([("AAA", "2013J", 1, 10, 0, 30), ("AAA", "2013J", 2, 10, 1, 80),
+                              ("BBB", "2014B", 3, 12, 2, 10)]),
+        "student_info": _info({("AAA", "2013J", 1): "Pass", ("AAA", "2013J", 2): "Fail",
+                               ("BBB", "2014B", 3): "Pass"}),
+    })
+    statements = []
+    event.listen(eng, "before_cursor_execute",
+                 lambda conn, cur, stmt, *a: statements.append(stmt))
+    return eng, statements
+
+
+def test_health_check_reuses_transform_metrics(tmp_path):
+    eng, statements = _health_db(tmp_path, "h.db")
+    backend = run_pipeline.MySQLBackend(eng)
+    backend.transform()
+    assert backend.metrics["early_risk_flags"] == {"scope": "table", "n_rows": 3,
+                                                   "invalid_flags": 0}
+
+    statements.clear()
+    backend.health_check()
+    assert not any("FROM early_risk_flags" in s or "FROM instructor_review_queue" in s
+                   for s in statements)
+    statements.clear()
+    assert backend.row_count("instructor_review_queue") == 3
+    assert statements == []
+
+
+def test_health_check_full_scans_once_per_table_and_fails(tmp_path):
+    eng, statements = _health_db(tmp_path, "h.db")
+    run_pipeline.transform(eng)
+    with eng.begin() as conn:
+        conn.execute(run_pipeline.text("UPDATE early_risk_flags SET low_engagement_flag = 7 "
+                                       "WHERE id_student = 3"))
+    statements.clear()
+    with pytest.raises(RuntimeError, match="1 invalid flag values"):
+        run_pipeline.health_check(eng)
+    assert sum("FROM early_risk_flags" in s for s in statements) == 1
+
+    # fast mode samples the first rows only; a sample that reaches the bad row fails too.
+    with pytest.raises(RuntimeError, match="invalid flag"):
+        run_pipeline.health_check(eng, "fast")
+
+
+def test_incremental_health_check_validates_only_rewritten_rows(tmp_path):
+    eng, _ = _health_db(tmp_path, "h.db")
+    backend = run_pipeline.MySQLBackend(eng)
+    backend.transform()
+    # A bad row in an untouched partition, then an incremental run touching AAA only.
+    with eng.begin() as conn:
+        conn.execute(run_pipeline.text("UPDATE early_risk_flags SET low_engagement_flag = 7 "
+                                       "WHERE id_student = 3"))
+    delta = _svle([("AAA", "2013J", 1, 10, 3, 5)])
+    delta.to_sql("student_vle", eng, index=False, if_exists="append")
+    delta.to_sql("student_vle_delta", eng, index=False)
+    _info({}).drop(columns="final_result").to_sql("student_info_delta", eng, index=False)
+
+    backend = run_pipeline.MySQLBackend(eng)
+    backend.transform(incremental=True)
+    assert backend.metrics["early_risk_flags"]["scope"] == "delta"
+    assert backend.metrics["early_risk_flags"]["n_rows"] == 1
+    backend.health_check("incremental")
+    with pytest.raises(RuntimeError, match="invalid flag"):
+        backend.health_check("full")
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — pandas backend (SQLite stands in for MySQL)
+# ═══════════════════════════════════════════════════════════════════
+
+def _comparable(df):
+    """Sort on the key columns and normalise dtypes so backends compare."""
+    keys = [c for c in ["code_module", "code_presentation", "id_student", "week_num"]
+            if c in df.columns]
+    out = df.sort_values(keys, na_position="first").reset_index(drop=True)
+    for col in out.columns:
+        if col in ("code_module", "code_presentation", "final_result"):
+            out[col] = out[col].astype(object).where(out[col].notna(), None)
+        else:
+            out[col] = pd.to_numeric(out[col]).astype("float64")
+    return out
+
+
+def test_pandas_transforms_match_sql(tmp_path):
+    """transform_frames reproduces TRANSFORMS row for row, NULLs included."""
+    vle = _svle([
+        ("AAA", "2013J", 1, 10, -8, 30), ("AAA", "2013J", 1, 10, -1, 5),
+        ("AAA", "2013J", 1, 10, 8, 20), ("AAA", "2013J", 2, 11, 1, 60),
+        ("AAA", "2013J", 2, 11, None, 3), ("AAA", "2013J", 3, 11, 15, None),
+        ("AAA", "2013J", 4, 11, 20, 49), ("BBB", "2014B", 5, 12, 2, 40),
+        ("BBB", "2014B", 6, 12, 3, 40), ("BBB", "2014B", 99, 12, 3, 7),
+    ]).astype({"id_student": "Int64", "id_site": "Int64", "date": "Int64",
+               "sum_click": "Int64"})
+    info = _info({("AAA", "2013J", 1): "Pass", ("AAA", "2013J", 2): "Fail",
+                  ("AAA", "2013J", 3): "Withdrawn", ("AAA", "2013J", 4): "Pass",
+                  ("BBB", "2014B", 5): "Fail", ("BBB", "2014B", 6): "Pass"})
+
+    # REAL dates make SQLite's date / 7 a true division, like MySQL's.
+    eng = _sqlite(tmp_path, "sql.db", {"student_vle": vle.astype({"date": "float64"}),
+                                       "student_info": info})
+    run_pipeline.transform(eng)
+    got = run_pipeline.transform_frames({"student_vle": vle, "student_info": info,
+                                         **_no_assessments()})
+
+    for name, _ in run_pipeline.TRANSFORMS:
+        want = pd.read_sql(f"SELECT * FROM {name}", eng)
+        pd.testing.assert_frame_equal(_comparable(got[name]), _comparable(want), obj=name)
+
+
+def test_pandas_backend_end_to_end(tmp_path, monkeypatch, mini_vle):
+    """main(--backend=pandas) runs every stage with no database."""
+    data = tmp_path / "data"
+    data.mkdir()
+    info = _info({("AAA", "2013J", 1): "Pass", ("AAA", "2013J", 2): "Fail"})
+    info.assign(num_of_prev_attempts=0, studied_credits=60).to_csv(
+        data / "studentInfo.csv", index=False)
+    info.drop(columns="final_result").assign(date_registration=-20).to_csv(
+        data / "studentRegistration.csv", index=False)
+    mini_vle.to_csv(data / "studentVle.csv", index=False)
+    for fname in ["courses.csv", "vle.csv"]:
+        (data / fname).write_text("code_module,code_presentation\nAAA,2013J\n")
+    for name, df in _no_assessments().items():
+        df.to_csv(data / run_pipeline.RAW_FILES[name], index=False)
+    monkeypatch.setattr(run_pipeline, "DATA_DIR", run_pipeline.DATA_DIR)
+    monkeypatch.setattr(run_pipeline, "OUTPUTS", tmp_path)
+    monkeypatch.setattr(run_pipeline, "LOG_FILE", tmp_path / "pipeline_run.log")
+
+    run_pipeline.main(["--backend", "pandas", "--data-dir", str(data)])
+
+    kpis = pd.read_csv(tmp_path / "pipeline_kpis.csv")
+    assert kpis.iloc[0].to_dict() == {"students_in_early_window": 2,
+                                      "flagged_students": 1,
+                                      "flagged_and_at_risk": 1}
+    top5 = pd.read_csv(tmp_path / "instructor_review_queue_top5_per_course.csv")
+    assert top5["id_student"].tolist() == [2, 1]
+    assert "health_checks: PASSED" in (tmp_path / "pipeline_run.log").read_text()
+
+    report = [json.loads(x) for x in (tmp_path / "run_report.ndjson").read_text().splitlines()]
+    assert {"stage", "transform", "run"} <= {r["kind"] for r in report}
+
+    # Nothing changed: the second run skips every stage.
+    (tmp_path / "pipeline_kpis.csv").unlink()
+    run_pipeline.main(["--backend", "pandas", "--data-dir", str(data)])
+    assert not (tmp_path / "pipeline_kpis.csv").exists()
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — typed extract and Arrow cache
+# ═══════════════════════════════════════════════════════════════════
+
+INFO_CSV = (
+    "code_module,code_presentation,id_student,gender,region,highest_education,"
+    "imd_band,age_band,num_of_prev_attempts,studied_credits,disability,final_result\n"
+    "AAA,2013J,11391,M,East Anglian Region,HE Qualification,90-100%,55<=,0,240,N,Pass\n"
+    "AAA,2013J,28400,F,Scotland,HE Qualification,?,35-55,?,60,N,Withdrawn\n"
+)
+
+
+def test_extract_uses_schema_dtypes(tmp_path):
+    """Strings become categoricals and '?' stays inside nullable small ints."""
+    path = tmp_path / "studentInfo.csv"
+    path.write_text(INFO_CSV)
+    df = run_pipeline.read_table("student_info", path)
+
+    assert isinstance(df["region"].dtype, pd.CategoricalDtype)
+    assert isinstance(df["code_module"].dtype, pd.CategoricalDtype)
+    assert str(df["num_of_prev_attempts"].dtype) == "Int16"
+    assert str(df["id_student"].dtype) == "Int32"
+    assert df["imd_band"].isna().tolist() == [False, True]
+    assert df.memory_usage(deep=True).sum() < run_pipeline._untyped_bytes(df)
+
+
+def test_extract_cache_hit_skips_csv_parse(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "studentInfo.csv"
+    path.write_text(INFO_CSV)
+    first = run_pipeline.read_table("student_info", path)
+
+    def no_parse(*args, **kwargs):
+        raise AssertionError("CSV re-parsed despite a current cache entry")
+
+    monkeypatch.setattr(run_pipeline.pd, "read_csv", no_parse)
+    second = run_pipeline.read_table("student_info", path)
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_extract_cache_invalidated_by_content_change(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "studentInfo.csv"
+    path.write_text(INFO_CSV)
+    run_pipeline.read_table("student_info", path)
+
+    path.write_text(INFO_CSV.replace("Withdrawn", "Fail"))
+    df = run_pipeline.read_table("student_info", path)
+    assert df["final_result"].tolist() == ["Pass", "Fail"]
+    assert len(list(run_pipeline.CACHE_DIR.glob("student_info-*.arrow"))) == 1
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — stage DAG scheduler
+# ═══════════════════════════════════════════════════════════════════
+
+def _dag(calls, fail=(), drops=None):
+    def step(name):
+        def run():
+            if name in fail:
+                raise RuntimeError(f"{name} broke")
+            time.sleep(0.05)
+            calls.append(name)
+            return (drops or {}).get(name)
+        return run
+
+    N = run_pipeline.Node
+    return [
+        N("extract:a", step("extract:a"), reads=["file:courses.csv"], writes={"a": None},
+          persistent=False),
+        N("extract:b", step("extract:b"), reads=["file:vle.csv"], writes={"b": None},
+          persistent=False),
+        N("load", step("load"), reads=["a", "b"], writes={"raw_a": ["a"], "raw_b": ["b"]},
+          drops=["da", "db"]),
+        N("t_a", step("t_a"), reads=["raw_a"], writes={"da": None}),
+        N("t_b", step("t_b"), reads=["raw_b"], writes={"db": None}),
+        N("export", step("export"), reads=["da", "db"]),
+    ]
+
+
+def test_dag_runs_independent_nodes_concurrently(data_dir):
+    calls = []
+    t0 = time.perf_counter()
+    durations = run_pipeline.run_dag(_dag(calls), workers=2)
+    elapsed = time.perf_counter() - t0
+
+    assert sorted(calls) == sorted(durations)
+    assert calls.index("load") > max(calls.index("extract:a"), calls.index("extract:b"))
+    assert calls[-1] == "export"
+    assert elapsed < sum(durations.values())  # the extracts and t_a/t_b overlapped
+    path, total = run_pipeline.critical_path(
+        ["extract:a", "load", "t_a", "export"],
+        {"extract:a": set(), "load": {"extract:a"}, "t_a": {"load"}, "export": {"t_a"}},
+        durations)
+    assert path == ["extract:a", "load", "t_a", "export"]
+
+
+def test_dag_skips_nodes_with_unchanged_inputs(data_dir, tmp_path):
+    state = tmp_path / "dag_state.json"
+    run_pipeline.run_dag(_dag([]), state_path=state)
+
+    calls = []
+    run_pipeline.run_dag(_dag(calls), state_path=state)
+    assert calls == []
+
+    (data_dir / "vle.csv").write_text("changed")
+    run_pipeline.run_dag(_dag(calls), state_path=state)
+    # load needs both in-memory extracts, but only b's branch is re-derived
+    assert sorted(calls) == ["export", "extract:a", "extract:b", "load", "t_b"]
+
+
+def test_dag_reruns_producers_of_tables_a_node_dropped(data_dir, tmp_path):
+    state = tmp_path / "dag_state.json"
+    run_pipeline.run_dag(_dag([]), state_path=state)
+
+    # vle.csv changed, and load fell back to a full load that dropped da too:
+    # t_a runs although raw_a's inputs are unchanged.
+    (data_dir / "vle.csv").write_text("rewritten")
+    calls = []
+    run_pipeline.run_dag(_dag(calls, drops={"load": ["da", "db"]}), state_path=state)
+    assert sorted(calls) == ["export", "extract:a", "extract:b", "load", "t_a", "t_b"]
+
+    calls.clear()
+    run_pipeline.run_dag(_dag(calls), state_path=state)
+    assert calls == []
+
+
+def test_dag_failure_stops_dependents(data_dir, tmp_path):
+    calls = []
+    state = tmp_path / "dag_state.json"
+    with pytest.raises(RuntimeError, match="t_a broke"):
+        run_pipeline.run_dag(_dag(calls, fail={"t_a"}), workers=2, state_path=state)
+    assert "export" not in calls
+
+    calls.clear()
+    run_pipeline.run_dag(_dag(calls), state_path=state)
+    assert sorted(calls) == ["export", "t_a"]
+
+
+def test_forced_run_failure_resumes_at_the_failed_node(data_dir, tmp_path):
+    state = tmp_path / "dag_state.json"
+    run_pipeline.run_dag(_dag([]), state_path=state)
+
+    # A forced run (--full-refresh) re-runs load, then t_b fails: load's
+    # signature is stored again, t_b's and export's are dropped.
+    calls = []
+    with pytest.raises(RuntimeError, match="t_b broke"):
+        run_pipeline.run_dag(_dag(calls, fail={"t_b"}), state_path=state, force=True)
+    assert "load" in calls
+    assert {"load", "t_a"} <= set(json.loads(state.read_text()))
+    assert not {"t_b", "export"} & set(json.loads(state.read_text()))
+
+    calls.clear()
+    run_pipeline.run_dag(_dag(calls), state_path=state)   # --resume: not forced
+    assert sorted(calls) == ["export", "t_b"]
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — run profiling
+# ═══════════════════════════════════════════════════════════════════
+
+def test_profiler_records_rows_and_round_trips(tmp_path):
+    prof = run_pipeline.RunProfiler()
+    monkey_engine = create_engine(f"sqlite:///{tmp_path / 'p.db'}")
+    run_pipeline.profiler, saved = prof, run_pipeline.profiler
+    try:
+        with prof.step("stage", "load"):
+            for i in range(2):
+                with prof.step("chunk", f"chunk {i}"):
+                    with monkey_engine.begin() as conn:
+                        conn.execute(run_pipeline.text("SELECT 1"))
+                        conn.execute(run_pipeline.text("SELECT 2"))
+                    prof.rows(1000)
+            prof.rows(2000)
+    finally:
+        run_pipeline.profiler = saved
+
+    recs = {r["name"]: r for r in prof.records}
+    assert recs["chunk 0"]["db_round_trips"] == 2
+    assert recs["load"]["db_round_trips"] == 4
+    assert recs["load"]["rows"] == 2000
+    assert recs["load"]["rows_per_sec"] > 0
+    assert recs["load"]["peak_rss_mb"] is None or recs["load"]["peak_rss_mb"] > 0
+
+    prof.write_ndjson(tmp_path / "report.ndjson", "passed")
+    lines = [json.loads(x) for x in (tmp_path / "report.ndjson").read_text().splitlines()]
+    assert [x["kind"] for x in lines] == ["chunk", "chunk", "stage", "run"]
+    assert lines[-1]["status"] == "passed"
+
+    prof.write_prometheus(tmp_path / "oulad.prom", "passed")
+    prom = (tmp_path / "oulad.prom").read_text()
+    assert 'oulad_pipeline_step_seconds{kind="stage",name="load"}' in prom
+    assert "chunk 0" not in prom
+    assert "oulad_pipeline_last_run_success 1" in prom
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — synthetic dataset and benchmark
+# ═══════════════════════════════════════════════════════════════════
+
+def test_generator_is_seeded_and_referentially_consistent(oulad_dir, tmp_path):
+    again = generate_oulad.generate(tmp_path, scale=0.002, seed=11)
+    for fname in again:
+        assert (tmp_path / fname).read_bytes() == (oulad_dir / fname).read_bytes()
+
+    t = {name: run_pipeline.read_table(name, oulad_dir / fname)
+         for name, fname in {**run_pipeline.RAW_FILES, "student_vle": "studentVle.csv"}.items()}
+    assert len(t["student_vle"]) == round(generate_oulad.CLICK_ROWS * 0.002)
+    for name, key in run_pipeline.PRIMARY_KEYS.items():
+        assert not t[name].duplicated(key).any(), name
+
+    def keys(df, cols):
+        return set(df[cols].astype(str).itertuples(index=False))
+
+    kc = run_pipeline.KEY_COLUMNS
+    assert keys(t["student_vle"], kc) <= keys(t["student_info"], kc)
+    assert keys(t["student_registration"], kc) == keys(t["student_info"], kc)
+    assert set(t["student_vle"]["id_site"]) <= set(t["vle"]["id_site"])
+    assert set(t["student_assessment"]["id_assessment"]) <= set(t["assessments"]["id_assessment"])
+    assert t["student_assessment"]["score"].isna().sum() < len(t["student_assessment"]) // 100
+
+
+def test_pipeline_runs_on_synthetic_dataset(oulad_dir, tmp_path, monkeypatch):
+    for name in ("DATA_DIR", "OUTPUTS", "LOG_FILE"):
+        monkeypatch.setattr(run_pipeline, name, getattr(run_pipeline, name))
+    run_pipeline.main(["--backend", "pandas", "--data-dir", str(oulad_dir),
+                       "--output-dir", str(tmp_path)])
+
+    kpi = pd.read_csv(tmp_path / "pipeline_kpis.csv").iloc[0]
+    assert 0 < kpi["flagged_and_at_risk"] <= kpi["flagged_students"] < kpi["students_in_early_window"]
+    # Engagement is tied to outcome, so flags concentrate on at-risk students.
+    assert kpi["flagged_and_at_risk"] > kpi["flagged_students"] / 2
+
+
+def test_benchmark_compare_rescales_by_calibration():
+    baseline = {"calibration": 1.0, "phases": {"extract": 2.0, "transform": 0.01}}
+    # A machine twice as slow may take twice as long ...
+    assert benchmark.compare({"calibration": 2.0, "phases": {"extract": 5.0}},
+                             baseline, tolerance=0.5) == []
+    # ... but not more than tolerance on top of that; tiny phases get MIN_SLACK.
+    slow = benchmark.compare({"calibration": 1.0, "phases": {"extract": 3.5, "transform": 0.05}},
+                             baseline, tolerance=0.5)
+    assert [(phase, allowed) for phase, _, allowed in slow] == [("extract", 3.0)]
+
+
+def test_benchmark_run_once_buckets_every_stage(oulad_dir, tmp_path, monkeypatch):
+    for name in ("DATA_DIR", "OUTPUTS", "LOG_FILE", "CACHE_DIR", "CACHE_INDEX"):
+        monkeypatch.setattr(run_pipeline, name, getattr(run_pipeline, name))
+    timings = benchmark.run_once("pandas", oulad_dir, tmp_path)
+    assert set(timings) == {*benchmark.PHASES, "other", "total"}
+    assert timings["score"] > 0 and timings["engagement_store"] > 0
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — trigger queue and in-process worker
+# ═══════════════════════════════════════════════════════════════════
+
+def test_trigger_queue_coalesces_a_burst_into_one_batch():
+    queue = trigger_watcher.TriggerQueue(settle=0.05)
+    for path in ["a/studentVle.csv", "a/courses.csv", "a/studentVle.csv"]:
+        queue.put(path, f"modified file: {path}")
+    assert queue.take() == {"a/studentVle.csv": "modified file: a/studentVle.csv",
+                            "a/courses.csv": "modified file: a/courses.csv"}
+    queue.close()
+    assert queue.take() is None
+
+
+def test_worker_merges_changes_during_a_run_into_one_follow_up():
+    queue = trigger_watcher.TriggerQueue(settle=0.01)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def run(argv, engine=None, triggers=None):
+        calls.append((argv, engine, triggers))
+        started.set()
+        release.wait(5)
+
+    worker = trigger_watcher.PipelineWorker(queue, ["--backend", "pandas"], run=run)
+    worker.start()
+    queue.put("d/studentVle.csv", "modified")
+    assert started.wait(5)
+    # Three events for two files while the first run is still going.
+    for path in ["d/studentInfo.csv", "d/courses.csv", "d/studentInfo.csv"]:
+        queue.put(path, "modified")
+    release.set()
+    deadline = time.time() + 5
+    while len(calls) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    queue.close()
+    worker.join(5)
+
+    assert [c[2] for c in calls] == [["studentVle.csv"], ["courses.csv", "studentInfo.csv"]]
+    assert all(c[0] == ["--backend", "pandas"] and c[1] is None for c in calls)
+
+
+def test_manifest_ignores_touch_and_identical_resave(tmp_path):
+    csv = tmp_path / "studentAssessment.csv"
+    csv.write_text("id_assessment,id_student,score\n1752,11391,78\n")
+    manifest = trigger_watcher.ContentManifest(tmp_path / "manifest.json")
+    changed = manifest.changed([csv])
+    assert list(changed) == [str(csv)]
+    manifest.update(changed)
+
+    os.utime(csv, ns=(time.time_ns() + 10**9,) * 2)  # touch
+    csv.write_text(csv.read_text())                     # re-save, same bytes
+    assert trigger_watcher.ContentManifest(tmp_path / "manifest.json").changed([csv]) == {}
+
+    csv.write_text("id_assessment,id_student,score\n1752,11391,80\n")
+    assert list(manifest.changed([csv, tmp_path / "gone.csv"])) == [str(csv)]
+
+
+def test_affected_steps_follow_table_lineage():
+    mysql = trigger_watcher.affected_steps(run_pipeline.parse_args([]), ["vle.csv"])
+    # Upserted by the load step, but nothing downstream reads vle.
+    assert "load" in mysql
+    assert not any(s.startswith(("transform:", "export:")) or s == "health_check"
+                   for s in mysql)
+
+    scores = trigger_watcher.affected_steps(run_pipeline.parse_args([]),
+                                            ["studentAssessment.csv"])
+    assert [s for s in scores if s.startswith("transform:")] == [
+        "transform:fact_assessment_performance"]
+
+    vle = trigger_watcher.affected_steps(run_pipeline.parse_args([]), ["studentVle.csv"])
+    assert sorted(s for s in vle if s.startswith("transform:")) == sorted(
+        f"transform:{n}" for n in run_pipeline.DERIVED_TABLES
+        if n != "fact_assessment_performance")
+    assert "export:kpis" in vle
+
+    info = trigger_watcher.affected_steps(run_pipeline.parse_args([]), ["studentInfo.csv"])
+    assert "transform:fact_weekly_engagement" not in info
+    assert "transform:engagement_with_outcomes" in info
+
+    # pandas keeps tables in memory, so their producers re-run with the readers.
+    info = trigger_watcher.affected_steps(run_pipeline.parse_args(["--backend", "pandas"]),
+                                          ["studentInfo.csv"])
+    assert {"extract:student_vle", "transform:fact_weekly_engagement"} <= set(info)
+    assert trigger_watcher.affected_steps(run_pipeline.parse_args(["--backend", "pandas"]),
+                                          ["courses.csv"]) == ["extract:courses"]
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — risk scoring
+# ═══════════════════════════════════════════════════════════════════
+
+def test_fit_logistic_recovers_known_coefficients():
+    rng = np.random.default_rng(3)
+    X = rng.normal(size=(50_000, 3))
+    w = np.array([1.5, -2.0, 0.0, -0.5])   # intercept last
+    y = (rng.random(len(X)) < run_pipeline._sigmoid(X @ w[:3] + w[3])).astype(float)
+    np.testing.assert_allclose(run_pipeline.fit_logistic(X, y, l2=0.0), w, atol=0.05)
+
+
+def test_risk_score_sql_matches_pandas(oulad_dir, tmp_path):
+    tables = {name: run_pipeline.read_table(name, oulad_dir / fname)
+              for name, fname in {**run_pipeline.RAW_FILES,
+                                  "student_vle": "studentVle.csv"}.items()}
+    # REAL dates make SQLite's date / 7 a true division, like MySQL's.
+    eng = _sqlite(tmp_path, "score.db", {
+        "student_vle": tables["student_vle"].astype({"date": "float64"}),
+        "student_info": tables["student_info"],
+        "student_registration": tables["student_registration"],
+    })
+    run_pipeline.transform(eng)
+    run_pipeline.score_risk(eng)
+    got = _derived(eng)["early_risk_flags"]
+
+    tables.update(run_pipeline.transform_frames(tables))
+    want = run_pipeline.score_frames(tables).sort_values(run_pipeline.KEY_COLUMNS)
+    assert got["risk_score"].between(0, 1).all()
+    np.testing.assert_allclose(got["risk_score"], want["risk_score"], rtol=1e-9)
+    # Students who went on to fail or withdraw score higher on average.
+    at_risk = got["final_result"].isin(run_pipeline.AT_RISK_RESULTS)
+    assert got.loc[at_risk, "risk_score"].mean() > got.loc[~at_risk, "risk_score"].mean()
+
+    # A rebuild drops the column; scoring again adds it back.
+    run_pipeline.transform(eng)
+    run_pipeline.score_risk(eng)
+    assert _derived(eng)["early_risk_flags"]["risk_score"].notna().all()
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — risk threshold / window sweep
+# ═══════════════════════════════════════════════════════════════════
+
+def test_risk_sweep_matches_pipeline_kpis_and_brute_force(oulad_dir):
+    svle = run_pipeline.read_table("student_vle", oulad_dir / "studentVle.csv")
+    info = run_pipeline.read_table("student_info", oulad_dir / "studentInfo.csv")
+    windows, thresholds = [(0, 2), (0, 0), (1, 4)], [0, 20, 50, 51, 400]
+    got = risk_sweep.sweep(svle, info, thresholds, windows).set_index(["window", "threshold"])
+
+    kpis = run_pipeline.PandasBackend(run_pipeline.transform_frames(
+        {"student_vle": svle, "student_info": info, **_no_assessments()})).kpis().iloc[0]
+    row = got.loc[("0-2", 50)]
+    assert (row["students_in_window"], row["flagged_students"], row["flagged_and_at_risk"]) == (
+        kpis["students_in_early_window"], kpis["flagged_students"], kpis["flagged_and_at_risk"])
+
+    # One groupby per setting, the way a pipeline re-run would compute it.
+    merged = svle.merge(info, on=run_pipeline.KEY_COLUMNS)
+    for first, last in windows:
+        rows = merged[(merged["date"] >= 7 * first) & (merged["date"] < 7 * (last + 1))]
+        per_student = rows.groupby(run_pipeline.KEY_COLUMNS, observed=True).agg(
+            clicks=("sum_click", "sum"), result=("final_result", "first"))
+        risky = per_student["result"].isin(risk_sweep.AT_RISK_RESULTS)
+        for t in thresholds:
+            flagged = per_student["clicks"] < t
+            row = got.loc[(f"{first}-{last}", t)]
+            assert row["students_in_window"] == len(per_student)
+            assert row["flagged_students"] == flagged.sum()
+            assert row["flagged_and_at_risk"] == (flagged & risky).sum()
+            assert row["recall"] == round((flagged & risky).sum() / risky.sum(), 4)
+
+
+def test_risk_sweep_cli_writes_every_combination(oulad_dir, tmp_path):
+    out = tmp_path / "sweep.csv"
+    assert risk_sweep.main(["--data-dir", str(oulad_dir), "--output", str(out),
+                            "--thresholds", "30,50", "--windows", "0-2,3"]) == 0
+    df = pd.read_csv(out)
+    assert list(df.columns) == risk_sweep.SWEEP_COLUMNS
+    assert list(zip(df["window"], df["threshold"])) == [
+        ("0-2", 30), ("0-2", 50), ("3-3", 30), ("3-3", 50)]
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — streaming exports
+# ═══════════════════════════════════════════════════════════════════
+
+def _read_export(path, fmt):
+    if fmt == "csv":
+        return pd.read_csv(path)
+    if fmt == "parquet":
+        return pd.read_parquet(path)
+    return run_pipeline.feather.read_table(path).to_pandas()
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "arrow"])
+def test_export_streams_batches_in_every_format(fmt, tmp_path):
+    table = pd.DataFrame({"id_student": range(7), "final_result": [None, None] + ["Pass"] * 5,
+                          "risk_score": [0.5] * 7})
+    eng = _sqlite(tmp_path, "exp.db", {"early_risk_flags": table})
+    batches = list(run_pipeline.stream_query(eng, "SELECT * FROM early_risk_flags", 2))
+    assert [len(b) for b in batches] == [2, 2, 2, 1]
+
+    path = tmp_path / f"erf.{fmt}"
+    assert run_pipeline.write_export(path, iter(batches), fmt) == 7
+    got = _read_export(path, fmt)
+    assert got["id_student"].tolist() == list(range(7))
+    assert got["final_result"].tolist()[2:] == ["Pass"] * 5
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+
+
+class _MySQLConnectorStub:
+    """Engine stand-in on the real mysqlconnector dialect, serving ``rows``
+    from a DBAPI cursor that records how it is opened and read."""
+
+    def __init__(self, rows):
+        self.rows, self.calls = list(rows), {"fetchmany": []}
+        self.dialect = mysqlconnector.dialect()
+        self.connection = self
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    def cursor(self, **kwargs):
+        self.calls["cursor"] = kwargs
+        return self
+
+    description = [("id_student",), ("final_result",)]
+
+    def execute(self, sql, args):
+        self.calls["execute"] = (sql, args)
+
+    def fetchmany(self, n):
+        self.calls["fetchmany"].append(n)
+        batch, self.rows[:n] = self.rows[:n], []
+        return batch
+
+    def close(self):
+        self.calls["closed"] = True
+
+
+def test_stream_query_reads_mysql_connector_unbuffered():
+    """mysqlconnector ignores stream_results, so batches come from an unbuffered cursor."""
+    assert not mysqlconnector.dialect().supports_server_side_cursors
+    stub = _MySQLConnectorStub([(i, "Pass") for i in range(5)])
+    sql = "SELECT * FROM early_risk_flags WHERE code_presentation IN (:p0)"
+
+    left = [len(stub.rows) for _ in run_pipeline.stream_query(stub, sql, 2, {"p0": "2013J"})]
+    assert left == [3, 1, 0]
+    assert stub.calls["cursor"] == {"buffered": False}
+    assert stub.calls["execute"] == (
+        "SELECT * FROM early_risk_flags WHERE code_presentation IN (%s)", ["2013J"])
+    assert set(stub.calls["fetchmany"]) == {2} and stub.calls["closed"]
+
+    # A consumer that stops early still leaves the connection usable.
+    stub = _MySQLConnectorStub([(i, "Pass") for i in range(5)])
+    batches = run_pipeline.stream_query(stub, "SELECT * FROM early_risk_flags", 2)
+    assert next(batches)["id_student"].tolist() == [0, 1]
+    batches.close()
+    assert stub.rows == [] and stub.calls["closed"]
+
+
+def test_failed_export_leaves_previous_file_in_place(tmp_path):
+    path = tmp_path / "queue.csv"
+    path.write_text("previous\n")
+
+    def batches():
+        yield pd.DataFrame({"x": [1]})
+        raise RuntimeError("connection lost")
+
+    with pytest.raises(RuntimeError, match="connection lost"):
+        run_pipeline.write_export(path, batches())
+    assert path.read_text() == "previous\n"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_extract_exports_run_as_dag_nodes(tmp_path, monkeypatch, data_dir):
+    out = tmp_path / "out"
+    out.mkdir()
+    monkeypatch.setattr(run_pipeline, "OUTPUTS", out)
+    monkeypatch.setattr(run_pipeline, "EXPORT_BATCH_ROWS", 2)
+    backend = run_pipeline.PandasBackend({"fact_weekly_engagement": pd.DataFrame(
+        {"id_student": range(5), "week_num": [0, 1, 2, 3, 4]})})
+    args = run_pipeline.parse_args(["--backend", "pandas", "--extract", "fact_weekly_engagement",
+                                    "--export-format", "parquet"])
+    nodes = {n.name: n for n in run_pipeline.build_dag(backend, args)}
+    assert nodes["export:fact_weekly_engagement"].reads == ["health_check"]
+    nodes["export:fact_weekly_engagement"].func()
+    got = pd.read_parquet(out / "fact_weekly_engagement.parquet")
+    assert got["week_num"].tolist() == [0, 1, 2, 3, 4]
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — load checkpoints and --resume (SQLite stand-in for MySQL)
+# ═══════════════════════════════════════════════════════════════════
+
+def _checkpoint_db(tmp_path):
+    eng = _sqlite(tmp_path, "ckpt.db", {"student_vle": _svle([]).astype("Int64")})
+
+    @event.listens_for(eng, "connect")
+    def _now(dbapi_conn, _):
+        dbapi_conn.create_function("NOW", 0, lambda: "2024-01-01 00:00:00")
+
+    eng.dispose()   # reconnect with NOW() registered
+    run_pipeline.run_sql_block(eng, run_pipeline.CHECKPOINT_DDL)
+    return eng
+
+
+def test_resumed_load_skips_committed_chunks(tmp_path, monkeypatch):
+    path = tmp_path / "studentVle.csv"
+    path.write_bytes((SVLE_CSV + "BBB,2014J,4,12,3,7\r\nBBB,2014J,5,12,9,1\r\n").encode())
+    monkeypatch.setattr(run_pipeline, "CHUNK_SIZE", 2)
+    fp = run_pipeline.load_fingerprint(path, "pandas")
+    eng = _checkpoint_db(tmp_path)
+
+    def checkpoint(i):
+        return "studentVle.csv", i, fp
+
+    # The DB drops during chunk 2's commit: its rows roll back with its checkpoint.
+    save = run_pipeline._save_checkpoint
+
+    def flaky(conn, ckpt, rows):
+        save(conn, ckpt, rows)
+        if ckpt[1] == 1:
+            raise OSError("connection lost")
+
+    monkeypatch.setattr(run_pipeline, "_save_checkpoint", flaky)
+    with pytest.raises(OSError):
+        run_pipeline.load_student_vle(eng, path, "pandas", checkpoint=checkpoint)
+    monkeypatch.setattr(run_pipeline, "_save_checkpoint", save)
+
+    done = run_pipeline.resumable_checkpoints(eng, {"studentVle.csv": fp})
+    assert done == {("studentVle.csv", 0): 2}
+    assert run_pipeline.resumable_checkpoints(eng, {"studentVle.csv": "other"}) == {}
+
+    written = []
+    real_write = run_pipeline._write_student_vle_chunk
+    monkeypatch.setattr(run_pipeline, "_write_student_vle_chunk",
+                        lambda *a, **kw: written.append(kw) or real_write(*a, **kw))
+    total = run_pipeline.load_student_vle(eng, path, "pandas", checkpoint=checkpoint,
+                                          done={i: n for (_, i), n in done.items()})
+    assert total == 5
+    assert len(written) == 2    # chunks 2 and 3 only
+    rows = pd.read_sql("SELECT id_student FROM student_vle ORDER BY id_student", eng)
+    assert rows["id_student"].tolist() == [1, 1, 2, 4, 5]
+    assert len(pd.read_sql("SELECT * FROM pipeline_checkpoint", eng)) == 3
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — review-queue service
+# ═══════════════════════════════════════════════════════════════════
+
+def _review_backend(oulad_dir):
+    tables = {name: run_pipeline.read_table(name, oulad_dir / fname)
+              for name, fname in {"student_vle": "studentVle.csv",
+                                  "student_info": "studentInfo.csv"}.items()}
+    backend = run_pipeline.PandasBackend({**tables, **_no_assessments()})
+    backend.transform()
+    return backend
+
+
+def _get(server, path):
+    import http.client
+
+    conn = http.client.HTTPConnection(*server.server_address[:2])
+    conn.request("GET", path)
+    resp = conn.getresponse()
+    body = json.loads(resp.read())
+    conn.close()
+    return resp.status, body
+
+
+def test_review_service_answers_from_the_index(oulad_dir):
+    backend = _review_backend(oulad_dir)
+    service = review_service.ReviewService(
+        lambda run_id: review_service.index_from_backend(backend, run_id))
+    server = review_service.serve(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        assert _get(server, "/review-queue/AAA/2013J")[0] == 503
+        service.reload("run-1")
+
+        top5 = backend.review_queue_top5()
+        module, presentation = top5.iloc[0][["code_module", "code_presentation"]]
+        status, body = _get(server, f"/review-queue/{module}/{presentation}")
+        course = top5.set_index(["code_module", "code_presentation"])
+        want = course.loc[[(module, presentation)]]
+        assert status == 200 and body["run_id"] == "run-1"
+        assert [s["id_student"] for s in body["students"]] == want["id_student"].tolist()
+        assert len(_get(server, f"/review-queue/{module}/{presentation}?n=2")[1]["students"]) == 2
+
+        fwe = backend.tables["fact_weekly_engagement"].dropna(subset=["week_num"])
+        row = fwe.iloc[0]
+        status, body = _get(server, f"/students/{row['code_module']}/"
+                                    f"{row['code_presentation']}/{row['id_student']}")
+        key = tuple(row[run_pipeline.KEY_COLUMNS])
+        weeks = fwe.set_index(run_pipeline.KEY_COLUMNS).loc[[key]].sort_values("week_num")
+        assert status == 200
+        assert [w["week_num"] for w in body["weeks"]] == weeks["week_num"].astype(int).tolist()
+        assert [w["total_clicks"] for w in body["weeks"]] == weeks["total_clicks"].tolist()
+
+        assert _get(server, "/kpis")[1] == {k: int(v) for k, v in
+                                            backend.kpis().iloc[0].items()}
+        assert _get(server, "/review-queue/ZZZ/2099J")[0] == 404
+        assert _get(server, "/students/AAA/2013J/x")[0] == 400
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_review_service_swaps_only_on_a_new_passed_run(tmp_path):
+    report = tmp_path / "run_report.ndjson"
+    builds = []
+
+    def loader(run_id):
+        builds.append(run_id)
+        if run_id == "r3":
+            raise RuntimeError("tables missing")
+        return review_service.ReviewIndex(
+            pd.DataFrame(columns=review_service.COURSE_KEYS + review_service.QUEUE_COLUMNS),
+            pd.DataFrame(columns=run_pipeline.KEY_COLUMNS + review_service.HISTORY_COLUMNS),
+            pd.DataFrame(), run_id)
+
+    def finish(run_id, status):
+        with open(report, "a") as f:
+            f.write(json.dumps({"run_id": run_id, "kind": "stage", "name": "load"}) + "\n")
+            f.write(json.dumps({"run_id": run_id, "kind": "run", "status": status}) + "\n")
+
+    service = review_service.ReviewService(loader, report)
+    assert not service.check_report()          # no report yet
+    finish("r1", "passed")
+    assert service.check_report() and service.index.run_id == "r1"
+    assert not service.check_report()          # report unchanged
+    finish("r2", "failed")
+    assert not service.check_report()
+    finish("r3", "passed")
+    assert not service.check_report()          # rebuild failed: r1 keeps serving
+    assert service.index.run_id == "r1"
+    assert builds == ["r1", "r3"]
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — memory-mapped engagement store
+# ═══════════════════════════════════════════════════════════════════
+
+def _weekly(oulad_dir):
+    svle = run_pipeline.read_table("student_vle", oulad_dir / "studentVle.csv")
+    return run_pipeline.PANDAS_TRANSFORMS["fact_weekly_engagement"]({"student_vle": svle})
+
+
+def test_engagement_store_matches_fact_weekly_engagement(oulad_dir, tmp_path):
+    weekly = _weekly(oulad_dir)
+    assert engagement_store.build_store(weekly, tmp_path) == 22
+    store = engagement_store.EngagementStore(tmp_path)
+    module, presentation = store.presentations()[0]
+
+    rows = weekly.dropna(subset=["week_num"])
+    rows = rows[(rows["code_module"] == module) & (rows["code_presentation"] == presentation)]
+    dense = (rows.pivot_table(index="id_student", columns="week_num", values="total_clicks",
+                              aggfunc="sum", fill_value=0)
+             .reindex(columns=store.weeks(module, presentation), fill_value=0))
+    student = dense.index[0]
+    got = store.student(module, presentation, student)
+    assert got["total_clicks"].tolist() == dense.loc[student].tolist()
+    assert got["n_events"].sum() == rows.loc[rows["id_student"] == student, "n_events"].sum()
+
+    np.testing.assert_allclose(store.cohort_mean(module, presentation), dense.mean())
+    some = dense.index[:3]
+    np.testing.assert_allclose(store.cohort_percentiles(module, presentation, [50], ids=some)[50],
+                               dense.loc[some].median())
+    with pytest.raises(KeyError):
+        store.student(module, presentation, -1)
+
+
+def test_engagement_store_rebuilds_one_presentation_only(oulad_dir, tmp_path):
+    weekly = _weekly(oulad_dir)
+    engagement_store.build_store(weekly, tmp_path)
+    files = {p.name: p.stat().st_ino for p in tmp_path.glob("*.bin")}
+
+    changed = weekly.assign(total_clicks=weekly["total_clicks"] + 1)
+    engagement_store.build_store(changed, tmp_path, presentations=["2013J"])
+    after = {p.name: p.stat().st_ino for p in tmp_path.glob("*.bin")}
+    assert after.keys() == files.keys()
+    rewritten = {name for name in files if after[name] != files[name]}
+    assert rewritten and all("_2013J." in name for name in rewritten)
+
+    engagement_store.build_store(weekly[weekly["code_module"] != "AAA"], tmp_path)
+    store = engagement_store.EngagementStore(tmp_path)
+    assert all(m != "AAA" for m, _ in store.presentations())
+    assert not list(tmp_path.glob("AAA_*"))
+
+
+def test_engagement_store_streams_listed_presentations(oulad_dir, tmp_path, monkeypatch):
+    """The pipeline streams course-ordered batches, only of the listed presentations."""
+    weekly = _weekly(oulad_dir)
+    engagement_store.build_store(weekly, tmp_path / "whole")
+    backend = run_pipeline.PandasBackend({"fact_weekly_engagement": weekly})
+    seen = []
+    stream_table = backend.stream_table
+
+    def stream(*args, **kwargs):
+        for batch in stream_table(*args, batch_rows=50, **kwargs):
+            seen.append(batch)
+            yield batch
+
+    monkeypatch.setattr(backend, "stream_table", stream)
+    monkeypatch.setattr(run_pipeline, "OUTPUTS", tmp_path)
+    run_pipeline.write_engagement_store(backend, ["2013J"])
+
+    assert set(pd.concat(seen)["code_presentation"]) == {"2013J"}
+    streamed = engagement_store.EngagementStore(tmp_path / "engagement_store")
+    whole = engagement_store.EngagementStore(tmp_path / "whole")
+    assert streamed.presentations() == [k for k in whole.presentations() if k[1] == "2013J"]
+    for module, presentation in streamed.presentations():
+        np.testing.assert_array_equal(streamed.matrix(module, presentation),
+                                      whole.matrix(module, presentation))
+        np.testing.assert_array_equal(streamed.weeks(module, presentation),
+                                      whole.weeks(module, presentation))
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — streaming pre-load validation
+# ═══════════════════════════════════════════════════════════════════
+
+def _oulad_copy(oulad_dir, tmp_path):
+    import shutil
+
+    data = tmp_path / "data"
+    shutil.copytree(oulad_dir, data)
+    return data
+
+
+def test_validation_streams_ranges_and_matches_materialized_tables(oulad_dir, monkeypatch):
+    monkeypatch.setattr(run_pipeline, "VALIDATE_RANGE_BYTES", 64 * 1024)
+    monkeypatch.setattr(run_pipeline, "VALIDATE_CHUNK_ROWS", 1000)
+    stats = run_pipeline.validate(oulad_dir, workers=1)
+
+    files = {**run_pipeline.RAW_FILES, "student_vle": "studentVle.csv"}
+    for name, fname in files.items():
+        df = run_pipeline.read_table(name, oulad_dir / fname)
+        assert stats[name]["rows"] == len(df), name
+        assert stats[name]["nulls"] == df.isna().sum().to_dict(), name
+    assert stats["student_vle"]["chunk_bytes"] < stats["student_vle"]["typed_bytes"] / 10
+
+
+@pytest.mark.parametrize("fname, edit, message", [
+    ("studentVle.csv", lambda t: t.replace('"AAA","2013J",', '"AAA",?,', 1), "NULL in"),
+    ("studentVle.csv", lambda t: t + '"AAA","2013J",1,2,3,-4\n', "sum_click < 0"),
+    ("studentVle.csv", lambda t: t + '"AAA","2013J",1,2,900,4\n', "date outside valid weeks"),
+    ("studentVle.csv", lambda t: t + '"AAA","2013J",1,2,3,4.5\n', "sum_click value"),
+    ("studentInfo.csv", lambda t: t + t.splitlines()[1] + "\n", "duplicate primary key"),
+])
+def test_validation_fails_fast(oulad_dir, tmp_path, monkeypatch, fname, edit, message):
+    data = _oulad_copy(oulad_dir, tmp_path)
+    (data / fname).write_text(edit((data / fname).read_text()))
+    monkeypatch.setattr(run_pipeline, "VALIDATE_RANGE_BYTES", 256 * 1024)
+    with pytest.raises(ValueError, match=message):
+        run_pipeline.validate(data, workers=2 if "NULL" in message else 1)
+
+
+def test_failed_validation_stops_the_load_before_any_ddl(oulad_dir, tmp_path, monkeypatch,
+                                                         recording_engine):
+    data = _oulad_copy(oulad_dir, tmp_path)
+    with open(data / "studentVle.csv", "a") as f:
+        f.write('"AAA","2013J",1,2,3,-4\n')
+    monkeypatch.setattr(run_pipeline, "DATA_DIR", data)
+    backend = run_pipeline.MySQLBackend(recording_engine)
+    nodes = run_pipeline.build_dag(backend, run_pipeline.parse_args(["--full-refresh"]))
+    with pytest.raises(ValueError, match="sum_click < 0"):
+        run_pipeline.run_dag(nodes, state_path=tmp_path / "state.json", force=True)
+    assert recording_engine.statements == []
+
+
+def test_incremental_run_validates_only_what_changed(tmp_path, monkeypatch, data_dir,
+                                                     oulad_dir):
+    eng = _load_engine(tmp_path, monkeypatch)
+    frames = _raw_frames(data_dir, oulad_dir)
+    run_pipeline.load(eng, frames)
+    backend, args = run_pipeline.MySQLBackend(eng), run_pipeline.parse_args([])
+    before = run_pipeline._dag_signatures(run_pipeline.build_dag(backend, args))
+    courses = data_dir / run_pipeline.RAW_FILES["courses"]
+    courses.write_text(courses.read_text() + '"ZZZ","2099J",200\n')
+    with open(data_dir / "studentVle.csv", "a") as f:
+        f.write('"AAA","2013J",1,2,3,4\n')
+    nodes = run_pipeline.build_dag(backend, args)
+    after = run_pipeline._dag_signatures(nodes)
+    assert {n for n in after if n.startswith("validate:") and after[n] != before[n]} == {
+        "validate:courses", "validate:student_vle"}
+
+    # studentVle.csv: only the row appended since the watermark is checked...
+    offset = run_pipeline.appended_from(eng, data_dir / "studentVle.csv")
+    assert offset > 0
+    stats = {n.name: n for n in nodes}["validate:student_vle"].func()
+    assert stats["student_vle"]["rows"] == 1
+
+    # ...and a load that falls back to a full refresh checks the rest first.
+    checked = []
+    validate = run_pipeline.validate
+    monkeypatch.setattr(run_pipeline, "validate",
+                        lambda *a, **k: checked.append(k["span"]) or validate(*a, **k))
+    with eng.begin() as conn:
+        conn.execute(run_pipeline.text("DELETE FROM student_vle"))
+    assert run_pipeline.load(eng, frames, full_refresh=False, validated_from=offset) == "full"
+    assert checked == [(0, offset)]
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — SQL plan capture (--profile-sql)
+# ═══════════════════════════════════════════════════════════════════
+
+def _profiled_transform(eng, out, run_id):
+    run_pipeline.sql_profiler.start("explain")
+    try:
+        run_pipeline.transform(eng)
+        return run_pipeline.sql_profiler.save(out, run_id)
+    finally:
+        run_pipeline.sql_profiler.start(None)
+
+
+def test_sql_profile_flags_plan_changes_and_regressions(tmp_path, monkeypatch):
+    vle = _svle([("AAA", "2013J", 1, 10, 1.0, 30), ("AAA", "2013J", 2, 10, 8.0, 5)])
+    info = _info({("AAA", "2013J", 1): "Pass", ("AAA", "2013J", 2): "Fail"})
+    eng = _sqlite(tmp_path, "plans.db", {"student_vle": vle, "student_info": info})
+    out = tmp_path / "sql_profile"
+
+    first, flagged = _profiled_transform(eng, out, "20240101T000000")
+    assert flagged == []
+    records = [json.loads(line) for line in first.read_text().splitlines()]
+    ctas = {r["step"]: r for r in records if r["sql"].startswith("CREATE TABLE")}
+    assert set(ctas) == {f"transform:{n}" for n in run_pipeline.DERIVED_TABLES
+                         if n not in run_pipeline.DERIVED_VIEWS}
+    assert ctas["transform:instructor_review_queue"]["plan"]["filesort"]
+    assert all(r["plan"] is None for r in records if r["sql"].startswith("DROP"))
+
+    # Indexes for the weeks 0-2 range and the student_info join change only
+    # early_risk_flags' plan; every statement also "regresses" against a first
+    # run that took no time.
+    with eng.begin() as conn:
+        conn.exec_driver_sql("CREATE INDEX idx_svle_date ON student_vle (date)")
+        conn.exec_driver_sql("CREATE INDEX idx_info ON student_info "
+                             "(code_module, code_presentation, id_student)")
+    eng.dispose()   # pooled SQLite connections cache the old EXPLAIN QUERY PLAN
+    first.write_text("".join(json.dumps({**r, "seconds": 0.0}) + "\n" for r in records))
+    monkeypatch.setattr(run_pipeline, "SQL_MIN_SLACK", 0.0)
+    _, flagged = _profiled_transform(eng, out, "20240101T000001")
+    assert {r["step"] for r in flagged if r["plan_changed"]} == {"transform:early_risk_flags"}
+    assert all(r["regressed"] for r in flagged if r["seconds"] > 0)
+
+    assert run_pipeline._select_part("INSERT INTO t (a, b) SELECT a, b FROM u") == \
+        "SELECT a, b FROM u"
+    assert run_pipeline._select_part("UPDATE t SET a = 1") is None
+
+
+def test_sql_profile_times_exports_without_the_consumer(tmp_path):
+    """A slow writer of the batches does not count against the export query."""
+    eng = _sqlite(tmp_path, "export.db", {"student_vle": _svle(
+        [("AAA", "2013J", i, 10, 0, 1) for i in range(6)])})
+    run_pipeline.sql_profiler.start("explain")
+    try:
+        for _ in run_pipeline.stream_query(eng, "SELECT * FROM student_vle", batch_rows=2):
+            time.sleep(0.1)
+        [record] = run_pipeline.sql_profiler.records
+    finally:
+        run_pipeline.sql_profiler.start(None)
+    assert record["seconds"] < 0.1
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — surrogate presentation keys (SQLite stand-in for MySQL)
+# ═══════════════════════════════════════════════════════════════════
+
+def _keyed(tables, key_mode):
+    """``tables`` as load(key_mode=...) stores them."""
+    if key_mode == "codes":
+        return dict(tables)
+    dim = run_pipeline.presentation_dim(tables["courses"])
+    keyed = {t: run_pipeline.encode_presentations(df, dim) for t, df in tables.items()}
+    return {**keyed, "dim_presentation": dim}
+
+
+def _exports(eng, tables=run_pipeline.EXTRACT_TABLES):
+    backend = run_pipeline.MySQLBackend(eng)
+    out = {t: pd.concat(backend.stream_table(t), ignore_index=True) for t in tables}
+    out["top5"] = backend.review_queue_top5()
+    return {name: _comparable(df) for name, df in out.items()}
+
+
+def test_surrogate_keys_give_the_same_exports(oulad_dir, tmp_path):
+    tables = {name: run_pipeline.read_table(name, oulad_dir / fname) for name, fname in [
+        ("courses", "courses.csv"), ("student_info", "studentInfo.csv"),
+        ("student_registration", "studentRegistration.csv"), ("student_vle", "studentVle.csv"),
+        ("assessments", "assessments.csv"), ("student_assessment", "studentAssessment.csv")]}
+    # REAL dates make SQLite's date / 7 a true division, like MySQL's.
+    tables["student_vle"] = tables["student_vle"].astype({"date": "float64"})
+
+    exports, engines = {}, {}
+    for key_mode in run_pipeline.KEY_MODES:
+        keyed = _keyed(tables, key_mode)
+        vle = keyed.pop("student_vle")
+        eng = engines[key_mode] = _sqlite(tmp_path, f"{key_mode}.db",
+                                          {**keyed, "student_vle": vle.iloc[:-500]})
+        assert run_pipeline.stored_key_mode(eng) == key_mode
+        run_pipeline.transform(eng)
+        # the last 500 rows arrive as an incremental load
+        vle.iloc[-500:].to_sql("student_vle", eng, index=False, if_exists="append")
+        vle.iloc[-500:].to_sql("student_vle_delta", eng, index=False)
+        keys = run_pipeline.keyed_columns(run_pipeline.KEY_COLUMNS, key_mode)
+        keyed["student_info"][keys].iloc[:0].to_sql("student_info_delta", eng, index=False)
+        run_pipeline.transform(eng, incremental=True)
+        run_pipeline.score_risk(eng)
+        exports[key_mode] = _exports(eng)
+
+    for name, want in exports["codes"].items():
+        pd.testing.assert_frame_equal(exports["surrogate"][name], want, obj=name)
+    assert "code_module" not in pd.read_sql("SELECT * FROM early_risk_flags LIMIT 1",
+                                            engines["surrogate"]).columns
+
+    # Per-presentation rebuilds map a code_presentation onto its ids.
+    eng = engines["surrogate"]
+    run_pipeline.transform(eng, workers=2)
+    run_pipeline.transform(eng, presentations=["2014J"])
+    tables = ["fact_weekly_engagement", "instructor_review_queue"]
+    got = _exports(eng, tables)
+    for name in tables + ["top5"]:
+        pd.testing.assert_frame_equal(got[name], exports["codes"][name], obj=name)
+
+    templates = [*dict(run_pipeline.TRANSFORMS).values(),
+                 *dict(run_pipeline.INCREMENTAL_TRANSFORMS).values(),
+                 *dict(run_pipeline.PARTITION_TRANSFORMS).values(),
+                 *run_pipeline.DERIVED_DDL.values(), run_pipeline.CREATE_DDL,
+                 run_pipeline.RISK_FEATURES_SQL, run_pipeline.RISK_UPDATE_SQL]
+    assert not any("code_" in run_pipeline.keyed_sql(sql, "surrogate") for sql in templates)
+
+
+def test_surrogate_key_load_and_storage_report(tmp_path, monkeypatch):
+    courses = pd.DataFrame({"code_module": ["BBB", "AAA"],
+                            "code_presentation": ["2014B", "2013J"]})
+    dim = run_pipeline.presentation_dim(courses)
+    assert dim.values.tolist() == [[1, "AAA", "2013J"], [2, "BBB", "2014B"]]
+    grown = run_pipeline.presentation_dim(
+        pd.concat([courses, pd.DataFrame({"code_module": ["AAA"],
+                                          "code_presentation": ["2012B"]})]), known=dim)
+    assert grown.values.tolist() == dim.values.tolist() + [[3, "AAA", "2012B"]]
+    sql = run_pipeline._load_data_sql("/tmp/x.csv", "student_vle",
+                                      run_pipeline.STUDENT_VLE_COLUMNS, "surrogate")
+    assert "SET presentation_id = (SELECT presentation_id FROM dim_presentation WHERE " \
+           "code_module = NULLIF(NULLIF(@code_module" in sql
+
+    rng = np.random.default_rng(3)
+    n = 5000
+    vle = _svle({"code_module": rng.choice(["AAA", "BBB"], n),
+                 "code_presentation": rng.choice(["2013J", "2014B"], n),
+                 "id_student": rng.integers(1, 300, n), "id_site": rng.integers(1, 50, n),
+                 "date": rng.integers(-5, 60, n).astype("float64"),
+                 "sum_click": rng.integers(1, 20, n)})
+    vle.loc[0, "code_module"] = "ZZZ"   # not in courses: a NULL presentation_id
+    info = _info({(m, p, s): "Pass" for m, p, s in vle[run_pipeline.KEY_COLUMNS].values})
+    courses = pd.DataFrame({"code_module": ["AAA", "AAA", "BBB", "BBB"],
+                            "code_presentation": ["2013J", "2014B", "2013J", "2014B"]})
+    monkeypatch.setattr(run_pipeline, "OUTPUTS", tmp_path)
+    for key_mode in run_pipeline.KEY_MODES:
+        tables = _keyed({"courses": courses, "student_vle": vle, "student_info": info,
+                         **_no_assessments()}, key_mode)
+        backend = run_pipeline.MySQLBackend(_sqlite(tmp_path, f"{key_mode}.db", tables))
+        run_pipeline.profiler.reset()
+        for name in run_pipeline.DERIVED_TABLES:
+            backend.transform_one(name)
+        report = run_pipeline.write_key_report(backend)
+
+    assert pd.isna(_keyed({"courses": courses, "student_vle": vle}, "surrogate")
+                   ["student_vle"].loc[0, "presentation_id"])
+    codes, surrogate = report["codes"]["tables"], report["surrogate"]["tables"]
+    assert surrogate["student_vle"]["rows"] == codes["student_vle"]["rows"] == n
+    assert surrogate["student_vle"]["data_bytes"] < codes["student_vle"]["data_bytes"]
+    assert "dim_presentation" in surrogate and "dim_presentation" not in codes
+    assert set(report["surrogate"]["transform_seconds"]) == set(run_pipeline.DERIVED_TABLES)
+    assert json.loads((tmp_path / run_pipeline.KEY_REPORT).read_text()) == report
+
+
+# ═══════════════════════════════════════════════════════════════════
+# UNIT TESTS — assessment performance fact (SQLite stand-in for MySQL)
+# ═══════════════════════════════════════════════════════════════════
+
+def test_assessment_performance_fact(tmp_path, oulad_dir):
+    assessments = pd.DataFrame({
+        "code_module": ["AAA"] * 3, "code_presentation": ["2013J"] * 3,
+        "id_assessment": [1, 2, 3], "assessment_type": ["TMA", "CMA", "Exam"],
+        "date": [10, 5, None], "weight": [20.0, 0.0, 80.0]}).astype(
+        run_pipeline.SCHEMA["assessments"])
+    submissions = pd.DataFrame({
+        "id_assessment": [1, 2, 3, 1, 2], "id_student": [1, 1, 1, 2, 2],
+        "date_submitted": [12, 5, 30, 3, 9], "is_banked": [0, 0, 0, 1, 0],
+        "score": [60, 90, 70, 50, None]}).astype(run_pipeline.SCHEMA["student_assessment"])
+    tables = {"assessments": assessments, "student_assessment": submissions}
+    eng = _sqlite(tmp_path, "fap.db", tables)
+    run_pipeline.transform_one(eng, "fact_assessment_performance")
+    got = pd.read_sql("SELECT * FROM fact_assessment_performance", eng)
+
+    # Student 2's first result is banked: it counts towards the scores but is
+    # neither late nor one of the student's own weekly submissions.  Their
+    # unscored CMA adds no weight; the exam has no deadline, so is never late.
+    rows = got.sort_values("id_student").drop(columns=["code_module", "code_presentation"])
+    assert rows.astype(object).where(rows.notna(), None).to_dict("records") == [
+        {"id_student": 1, "n_assessments": 3, "n_banked": 0, "weighted_score": 68.0,
+         "first_assessment_score": 90.0, "n_late": 1, "days_late": 2,
+         "submissions_per_week": 0.6},
+        {"id_student": 2, "n_assessments": 2, "n_banked": 1, "weighted_score": 50.0,
+         "first_assessment_score": None, "n_late": 1, "days_late": 4,
+         "submissions_per_week": 0.5},
+    ]
+    assert [ix["column_names"] for ix in inspect(eng).get_indexes(
+        "fact_assessment_performance")] == [["code_module", "code_presentation", "id_student"]]
+    want = run_pipeline.transform_frames({**tables, "student_vle": _svle([]),
+                                          "student_info": _info({})})
+    pd.testing.assert_frame_equal(_comparable(want["fact_assessment_performance"]),
+                                  _comparable(got))
+
+    # The synthetic dataset: NULL exam dates and scores, banked and late results.
+    tables = {name: run_pipeline.read_table(name, oulad_dir / run_pipeline.RAW_FILES[name])
+              for name in ["assessments", "student_assessment"]}
+    eng = _sqlite(tmp_path, "oulad.db", tables)
+    run_pipeline.transform_one(eng, "fact_assessment_performance", workers=2)
+    got = pd.read_sql("SELECT * FROM fact_assessment_performance", eng)
+    want = run_pipeline.transform_frames({**tables, "student_vle": _svle([]),
+                                          "student_info": _info({})})
+    assert got["n_late"].sum() > 0 and got["n_banked"].sum() > 0
+    pd.testing.assert_frame_equal(_comparable(want["fact_assessment_performance"]),
+                                  _comparable(got))
+
+
 # ═══════════════════════════════════════════════════════════════════
 # INTEGRATION TESTS — require running MySQL with pipeline executed
 # ═══════════════════════════════════════════════════════════════════